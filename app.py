@@ -1,17 +1,28 @@
 import streamlit as st
-from rembg import remove
-from PIL import Image, ImageDraw
+from PIL import Image, ImageDraw, ImageOps
 import io
 import os
-import zipfile
 from streamlit_extras.add_vertical_space import add_vertical_space
 import numpy as np
-from typing import Optional, Tuple, List
-import uuid
+from typing import Any, Dict, Iterator, Optional, Tuple, List
+import threading
+import time
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from pipeline import DEFAULT_WORKERS, run_pipeline
+from segmentation import MODEL_MAP, DEFAULT_PRESET, DEFAULT_BATCH_SIZE, get_session, inference_signature, resolve_preset, resolve_refinement, ort_settings, predict_mask, predict_masks, cutout_with_mask, get_available_presets, get_available_models
+from mask_cache import content_hash, mask_key, get_cached_mask, put_cached_mask
+from compositing import composite_over
+from refinement import MATTING_ENABLED, matte_edges, matting_available
+from validation import UploadRejected, draft_scale, validate_batch
+from settings import get_setting
+from archive import StreamingArchive
+from result_cache import get_cached_result, put_cached_result, result_id
+from background_library import BACKGROUND_DIR, fit_preset, preset_library
+from encoders import JPEG_SUBSAMPLING, output_settings, get_composite_formats, get_cutout_formats, encode_image, mime_type
 
 # Import from backgrounds module
 try:
-    from backgrounds import COLOR_MAP, generate_background, STYLE_MAP, get_available_styles, get_available_colors
+    from backgrounds import COLOR_MAP, generate_background, generate_preview, STYLE_MAP, get_available_styles, get_available_colors, linear_gradient_bg, dot_pattern_bg
     BACKGROUNDS_MODULE_AVAILABLE = True
 except ImportError:
     BACKGROUNDS_MODULE_AVAILABLE = False
@@ -19,20 +30,19 @@ except ImportError:
 
 # Fallback function for gradient background
 def create_gradient_background(color1: Tuple[int, int, int], color2: Tuple[int, int, int], size: Tuple[int, int] = (800, 600)) -> Image.Image:
-    img = Image.new('RGB', size, color=color1)  # type: ignore
-    draw = ImageDraw.Draw(img)
-    
-    for i in range(size[1]):
-        ratio = i / size[1]
-        r = int(color1[0] * (1 - ratio) + color2[0] * ratio)
-        g = int(color1[1] * (1 - ratio) + color2[1] * ratio)
-        b = int(color1[2] * (1 - ratio) + color2[2] * ratio)
-        draw.line([(0, i), (size[0], i)], fill=(r, g, b))
+    if BACKGROUNDS_MODULE_AVAILABLE:
+        return linear_gradient_bg(color1, color2, size=size)
     
-    return img
+    ratio = (np.arange(size[1], dtype=np.float32) / size[1])[:, None, None]
+    arr = np.asarray(color1, dtype=np.float32) * (1 - ratio) + np.asarray(color2, dtype=np.float32) * ratio
+    arr = np.broadcast_to(arr.astype(np.uint8), (size[1], size[0], 3))
+    return Image.fromarray(np.ascontiguousarray(arr), 'RGB')
 
 # Fallback function for pattern background
 def create_pattern_background(size: Tuple[int, int] = (800, 600)) -> Image.Image:
+    if BACKGROUNDS_MODULE_AVAILABLE:
+        return dot_pattern_bg((240, 240, 250), (200, 200, 230), size=size)
+    
     img = Image.new('RGB', size, color=(240, 240, 250))  # type: ignore
     draw = ImageDraw.Draw(img)
     
@@ -43,24 +53,20 @@ def create_pattern_background(size: Tuple[int, int] = (800, 600)) -> Image.Image
     return img
 
 # Function to replace background
-def replace_background(original_img: Image.Image, background_removed_img: Image.Image, new_background: Optional[Image.Image] = None, bg_color: Optional[Tuple[int, int, int]] = None) -> Image.Image:
+def replace_background(original_img: Image.Image, mask: Image.Image, new_background: Optional[Image.Image] = None, bg_color: Optional[Tuple[int, int, int]] = None) -> Image.Image:
+    # Accept either the segmentation mask or an RGBA cutout carrying it as alpha
+    alpha = mask.getchannel('A') if mask.mode == 'RGBA' else mask
     if bg_color:
-        bg = Image.new('RGB', original_img.size, color=bg_color)  # type: ignore
+        bg = bg_color
     elif new_background:
-        bg = new_background.resize(original_img.size, Image.Resampling.LANCZOS)
-        if bg.mode != 'RGB':
-            bg = bg.convert('RGB')
+        bg = new_background
+        if bg.size != original_img.size:
+            bg = bg.resize(original_img.size, Image.Resampling.LANCZOS)
     else:
-        return background_removed_img
-    
-    if background_removed_img.mode != 'RGBA':
-        background_removed_img = background_removed_img.convert('RGBA')
+        return cutout_with_mask(original_img, alpha)
     
-    result = Image.new('RGB', original_img.size, color=(255, 255, 255))  # type: ignore
-    result.paste(bg, (0, 0))
-    result.paste(background_removed_img, (0, 0), background_removed_img)
-    
-    return result
+    # Single fixed-point pass straight into the final RGB buffer
+    return composite_over(original_img, alpha, bg)
 
 # Enhanced CSS with perfect mobile/desktop and dark/light mode support
 st.markdown("""
@@ -708,6 +714,93 @@ with st.container():
 # Sidebar
 with st.sidebar:
     st.markdown("### Settings")
+    quality_preset: str = st.selectbox(
+        "Speed / quality preset:",
+        get_available_presets(),
+        index=get_available_presets().index(DEFAULT_PRESET),
+        help="Fast uses a small (int8 when available) model; Quality uses a larger, slower model",
+        key="quality_preset"
+    )
+    custom_model: Optional[str] = None
+    custom_quantized = False
+    custom_refine = False
+    if quality_preset == "Custom":
+        custom_model = MODEL_MAP[st.selectbox(
+            "Segmentation model:",
+            get_available_models(),
+            help="Smaller models are faster on CPU; larger ones give cleaner edges",
+            key="segmentation_model"
+        )]
+        custom_quantized = st.checkbox("Use int8-quantized model if available", key="quantized_model")
+        custom_refine = st.checkbox("Refine subject crop", help="Segment again on a crop around the subject for cleaner edges", key="refine_subject")
+    model_name, quantized = resolve_preset(quality_preset, custom_model, custom_quantized)
+    refine = resolve_refinement(quality_preset, custom_refine)
+    st.caption(f"Model: {model_name}{' (int8)' if quantized else ''}{' + subject refinement' if refine else ''}")
+    edge_matting: bool = st.checkbox(
+        "Edge matting (hair detail)",
+        value=MATTING_ENABLED and matting_available(),
+        disabled=not matting_available(),
+        help="Refine the subject's outline with alpha matting; runs only on the uncertain edge band",
+        key="edge_matting"
+    )
+    inference_batch_size: int = st.slider(
+        "Inference batch size",
+        1, 32, DEFAULT_BATCH_SIZE,
+        help="Images segmented together in one model call; 1 processes images one at a time",
+        key="inference_batch_size"
+    )
+    pipeline_workers: int = st.slider(
+        "Worker threads",
+        1, max(16, DEFAULT_WORKERS), DEFAULT_WORKERS,
+        help="Images decoded, composited and encoded in parallel",
+        key="pipeline_workers"
+    )
+    with st.expander("Output settings"):
+        output_defaults = output_settings()
+        composite_format: str = st.selectbox(
+            "Format with background:",
+            get_composite_formats(),
+            index=get_composite_formats().index(output_defaults["composite_format"]),
+            key="composite_format"
+        )
+        cutout_format: str = st.selectbox(
+            "Format for Remove Only:",
+            get_cutout_formats(),
+            index=get_cutout_formats().index(output_defaults["cutout_format"]),
+            help="WebP keeps transparency and is usually much smaller than PNG",
+            key="cutout_format"
+        )
+        output_options = dict(output_defaults, composite_format=composite_format, cutout_format=cutout_format)
+        if composite_format == "JPEG":
+            output_options["jpeg_quality"] = st.slider("JPEG quality", 50, 100, output_defaults["jpeg_quality"], key="jpeg_quality")
+            output_options["jpeg_subsampling"] = st.selectbox(
+                "JPEG chroma subsampling",
+                list(JPEG_SUBSAMPLING.keys()),
+                index=list(JPEG_SUBSAMPLING.keys()).index(output_defaults["jpeg_subsampling"]),
+                help="4:4:4 keeps full color detail; 4:2:0 gives smaller files",
+                key="jpeg_subsampling"
+            )
+            output_options["jpeg_progressive"] = st.checkbox("Progressive JPEG", value=output_defaults["jpeg_progressive"], key="jpeg_progressive")
+            output_options["jpeg_optimize"] = st.checkbox("Optimize JPEG tables (smaller, slower)", value=output_defaults["jpeg_optimize"], key="jpeg_optimize")
+        if "WebP" in (composite_format, cutout_format):
+            output_options["webp_lossless"] = st.checkbox("Lossless WebP", value=output_defaults["webp_lossless"], key="webp_lossless")
+            output_options["webp_quality"] = st.slider("WebP quality", 50, 100, output_defaults["webp_quality"], key="webp_quality")
+            output_options["webp_method"] = st.slider(
+                "WebP effort", 0, 6, output_defaults["webp_method"],
+                help="Higher is smaller but slower to encode",
+                key="webp_method"
+            )
+        if "PNG" in (composite_format, cutout_format):
+            output_options["png_compress_level"] = st.slider(
+                "PNG compression level", 0, 9, output_defaults["png_compress_level"],
+                help="1 is fast with larger files; 9 is slowest and smallest",
+                key="png_compress_level"
+            )
+            output_options["png_optimize"] = st.checkbox("Optimize PNG (slower)", value=output_defaults["png_optimize"], key="png_optimize")
+    with st.expander("ONNX Runtime settings"):
+        runtime_settings = ort_settings()
+        st.markdown("\n".join(f"- **{key}**: `{value}`" for key, value in runtime_settings.items()))
+        st.caption("Set in bg_pro.toml [onnxruntime] or BGPRO_ONNXRUNTIME_* environment variables. 0 threads = onnxruntime default.")
     add_vertical_space(1)
     
     st.markdown("### About")
@@ -726,6 +819,10 @@ with st.sidebar:
     - Mobile & desktop optimized
     """)
 
+# Load and warm up the selected segmentation session once per process (no-op on reruns)
+with st.spinner("Loading background removal model..."):
+    get_session(model_name, quantized)
+
 # Main content
 with st.container():
     st.markdown('<div class="card">', unsafe_allow_html=True)
@@ -741,19 +838,11 @@ with st.container():
     selected_background: Optional[Image.Image] = None
     background_color: Optional[Tuple[int, int, int]] = None
     style_choice: str = "Solid Color"
+    studio_spec: Optional[Tuple[str, str, Optional[str]]] = None
     selected_bg_file: Optional[str] = None
-
-    # Track background selections for cache invalidation
-    if "prev_style_choice" not in st.session_state:
-        st.session_state.prev_style_choice = style_choice
-    if "prev_color_choice" not in st.session_state:
-        st.session_state.prev_color_choice = None
-    if "prev_custom_color_hex" not in st.session_state:
-        st.session_state.prev_custom_color_hex = None
-    if "prev_selected_bg_file" not in st.session_state:
-        st.session_state.prev_selected_bg_file = None
-    if "prev_custom_bg" not in st.session_state:
-        st.session_state.prev_custom_bg = None
+    # Identifies the selected background in the composite cache key, so changing it
+    # only re-runs compositing and never invalidates anyone's cached masks
+    background_fingerprint: Optional[tuple] = None
 
     if bg_option == "Studio Backgrounds" and BACKGROUNDS_MODULE_AVAILABLE:
         with st.expander("Studio Background Settings", expanded=True):
@@ -776,24 +865,17 @@ with st.container():
                 use_custom_color = st.checkbox("Use custom color", key="custom_color_check")
                 custom_color_hex = st.color_picker("Custom color", "#FFFFFF", key="custom_color_picker") if use_custom_color else None
             
-            # Clear cache if background settings change
-            if (st.session_state.prev_style_choice != style_choice or
-                st.session_state.prev_color_choice != color_choice or
-                st.session_state.prev_custom_color_hex != custom_color_hex):
-                st.cache_data.clear()
-                st.session_state.prev_style_choice = style_choice
-                st.session_state.prev_color_choice = color_choice
-                st.session_state.prev_custom_color_hex = custom_color_hex
-            
+            # Studio backgrounds are rendered per image at its own size during compositing;
+            # only a small preview is rendered here
+            studio_spec = (style_choice, color_choice or "White", custom_color_hex)
             try:
-                selected_background = generate_background(
+                preview_background = generate_preview(
                     style=style_choice,
                     color_name=color_choice or "White",
-                    custom_color_hex=custom_color_hex,
-                    size=(800, 1000)
+                    custom_color_hex=custom_color_hex
                 )
-                if selected_background:
-                    st.image(selected_background, caption=f"{style_choice} Preview", width=200)
+                if preview_background:
+                    st.image(preview_background, caption=f"{style_choice} Preview", width=200)
             except Exception as e:
                 st.error(f"Error generating studio background: {str(e)}")
 
@@ -823,22 +905,19 @@ with st.container():
 
     elif bg_option == "Preset Backgrounds":
         with st.expander("Preset Backgrounds", expanded=True):
-            bg_folder = "backgrounds"
-            if os.path.exists(bg_folder):
-                bg_files = [f for f in os.listdir(bg_folder) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.webp'))]
-                if bg_files:
-                    selected_bg_file = st.selectbox("Choose a background:", bg_files, key="preset_bg")
+            if os.path.isdir(BACKGROUND_DIR):
+                # The library is indexed once per process; reruns only stat the folder and reuse decoded presets
+                try:
+                    presets = {preset.name: preset for preset in preset_library()}
+                except Exception as e:
+                    presets = {}
+                    st.error(f"Error loading background: {str(e)}")
+                if presets:
+                    selected_bg_file = st.selectbox("Choose a background:", list(presets), key="preset_bg")
                     if selected_bg_file:
-                        try:
-                            selected_background = Image.open(os.path.join(bg_folder, selected_bg_file))
-                            if selected_background:
-                                st.image(selected_background, caption="Selected Background", width=200)
-                        except Exception as e:
-                            st.error(f"Error loading background: {str(e)}")
-                    # Clear cache if background file changes
-                    if st.session_state.prev_selected_bg_file != selected_bg_file:
-                        st.cache_data.clear()
-                        st.session_state.prev_selected_bg_file = selected_bg_file
+                        preset = presets[selected_bg_file]
+                        background_fingerprint = ("preset", preset.name, preset.mtime)
+                        st.image(preset.thumbnail, caption="Selected Background", width=200)
                 else:
                     st.warning("No background images found in backgrounds folder. Create a 'backgrounds' folder with .png, .jpg, or .webp files.")
             else:
@@ -848,6 +927,7 @@ with st.container():
                     ["Gradient Blue", "Gradient Purple", "Gradient Green", "Abstract Pattern"],
                     key="online_bg"
                 )
+                background_fingerprint = ("generated", online_bg_option)
                 if online_bg_option == "Gradient Blue":
                     selected_background = create_gradient_background((100, 150, 255), (200, 220, 255))
                 elif online_bg_option == "Gradient Purple":
@@ -869,13 +949,10 @@ with st.container():
             )
             if custom_bg:
                 try:
+                    background_fingerprint = ("custom", content_hash(custom_bg.getvalue()))
                     selected_background = Image.open(custom_bg)
                     if selected_background:
                         st.image(selected_background, caption="Custom Background", width=200)
-                    # Clear cache if custom background changes
-                    if st.session_state.prev_custom_bg != custom_bg:
-                        st.cache_data.clear()
-                        st.session_state.prev_custom_bg = custom_bg
                 except Exception as e:
                     st.error(f"Error loading custom background: {str(e)}. Ensure the file is a valid image (PNG, JPG, JPEG, or WEBP).")
 
@@ -896,59 +973,196 @@ with st.container():
             max_width = st.slider("Max width (px)", 200, 2000, 800, help="Set maximum width for resized images", key="resize_slider")
     
     if st.button("Reset All", key="reset_button"):
-        st.cache_data.clear()  # Clear cache on reset
+        # Reset this session's selections only; shared caches stay warm for other users
+        st.session_state.clear()
         st.rerun()  # type: ignore
     
     st.markdown('</div>', unsafe_allow_html=True)
 
-# Cache image processing
-@st.cache_data
-def process_image(image_data: bytes, max_width: Optional[int], bg_option: str, _selected_background: Optional[Image.Image], background_color: Optional[Tuple[int, int, int]], style_choice: str) -> Tuple[str, bytes, Image.Image]:
-    try:
-        stream = io.BytesIO(image_data)
-        stream.seek(0)
-        with Image.open(stream) as img:
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            if max_width:
-                ratio = max_width / img.width
-                new_height = int(img.height * ratio)
-                img = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
-            
-            bg_removed = remove(img)
-            if isinstance(bg_removed, Image.Image):
-                output_image = bg_removed
-            else:
-                stream = io.BytesIO(bg_removed)
-                stream.seek(0)
-                output_image = Image.open(stream)
-            
-            if bg_option != "Remove Only":
-                final_image = replace_background(img, output_image, _selected_background, background_color)
-                output_format = "JPEG"
-                file_extension = "jpg"
-                mime_type = "image/jpeg"
-            else:
-                final_image = output_image
-                output_format = "PNG"
-                file_extension = "png"
-                mime_type = "image/png"
-            
-            output_stream = io.BytesIO()
-            if output_format == "PNG":
-                final_image.save(output_stream, format="PNG")
-            else:
-                final_image.save(output_stream, format="JPEG", quality=95)
-            
-            output_stream.seek(0)
-            base_name = "processed"
-            style_name = style_choice.lower().replace(" ", "_")
-            filename = f"{bg_option.lower().replace(' ', '_')}_{style_name}_{base_name}_{uuid.uuid4().hex[:8]}.{file_extension}"
-            
-            return filename, output_stream.getvalue(), final_image
-    except Exception as e:
-        raise ValueError(f"Invalid image file: {str(e)}. Ensure the file is a valid PNG, JPG, JPEG, or WEBP.")
+# Results gallery: cards per page and the width of the "Original" and "Processed" thumbnails
+GALLERY_PAGE_SIZE = get_setting("gallery", "page_size", 12)
+PREVIEW_WIDTH = get_setting("gallery", "thumbnail_width", 240)
+
+# Decoding at reduced JPEG scale keeps at least this multiple of the target size before the final resample
+DECODE_REDUCING_GAP = 2.0
+
+# Decode an upload into the RGB working image used for segmentation, compositing and the preview
+def load_working_image(image_data: bytes, max_width: Optional[int], max_pixels: Optional[int] = None) -> Image.Image:
+    with Image.open(io.BytesIO(image_data)) as img:
+        orientation = img.getexif().get(0x0112, 1)
+        # EXIF orientations 5-8 are stored rotated by 90 degrees
+        display_size = img.size if orientation < 5 else img.size[::-1]
+        draft_size = img.size
+        target = None
+        if max_width and display_size[0] > max_width:
+            target = (max_width, max(1, int(display_size[1] * max_width / display_size[0])))
+            wanted = (int(target[0] * DECODE_REDUCING_GAP), int(target[1] * DECODE_REDUCING_GAP))
+            draft_size = wanted if orientation < 5 else wanted[::-1]
+        if max_pixels and img.width * img.height > max_pixels:
+            # Oversized uploads admitted for downscaling must decode within the pixel limit
+            scale = draft_scale(img.size, max_pixels)
+            if scale:
+                draft_size = (min(draft_size[0], img.width // scale), min(draft_size[1], img.height // scale))
+        if draft_size != img.size:
+            # Let JPEG decode straight into a DCT-scaled image near the requested size (no-op for other formats)
+            img.draft(None, draft_size)
+        if max_pixels and img.width * img.height > max_pixels:
+            raise UploadRejected(f"image is {img.width}x{img.height}, over the {max_pixels} pixel limit")
+        
+        # Apply EXIF orientation up front so the mask, composite and preview all agree
+        if orientation != 1:
+            img = ImageOps.exif_transpose(img)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        
+        # Only ever downscale; narrower images keep their size
+        if target and img.size != target:
+            img = img.resize(target, Image.Resampling.LANCZOS, reducing_gap=DECODE_REDUCING_GAP)
+        
+        img.load()
+        return img
+
+# Downscale the working image for the "Original" preview instead of decoding the upload again
+def make_preview(img: Image.Image) -> Image.Image:
+    if img.width <= PREVIEW_WIDTH:
+        return img
+    height = max(1, round(img.height * PREVIEW_WIDTH / img.width))
+    return img.resize((PREVIEW_WIDTH, height), Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+# Predicted masks for a chunk, served from the mask cache where possible
+def _predicted_masks(working: List[Tuple[str, Image.Image]], model_name: str, quantized: bool, batch_size: int, refine: bool) -> List[Image.Image]:
+    keys = [mask_key(image_hash, model_name, quantized, img.size, inference_signature(refine)) for image_hash, img in working]
+    masks: List[Optional[Image.Image]] = [get_cached_mask(key) for key in keys]
+    missing = [i for i, mask in enumerate(masks) if mask is None]
+    if missing:
+        working_images = [working[i][1] for i in missing]
+        new_masks: Optional[List[Image.Image]] = None
+        if batch_size > 1 and len(missing) > 1:
+            try:
+                new_masks = predict_masks(working_images, model_name, quantized, batch_size, refine)
+            except Exception:
+                new_masks = None  # e.g. a graph that rejects batched input; fall back to one at a time
+        if new_masks is None:
+            new_masks = [predict_mask(img, model_name, quantized, refine) for img in working_images]
+        for i, mask in zip(missing, new_masks):
+            put_cached_mask(keys[i], mask)
+            masks[i] = mask
+    return masks  # type: ignore
+
+# Segmentation stage: masks are cached by content hash + working size + model + inference settings, independent of the background.
+# Matted masks get their own cache entries keyed by the matting settings too; the seconds spent matting are
+# returned per image (None when the matted mask came from the cache or matting is off)
+def segment_images(working: List[Tuple[str, Image.Image]], model_name: str, quantized: bool, batch_size: int, refine: bool = False, matting: bool = False) -> Tuple[List[Image.Image], List[Optional[float]]]:
+    matting_times: List[Optional[float]] = [None] * len(working)
+    if not matting:
+        return _predicted_masks(working, model_name, quantized, batch_size, refine), matting_times
+    keys = [mask_key(image_hash, model_name, quantized, img.size, inference_signature(refine, matting)) for image_hash, img in working]
+    masks: List[Optional[Image.Image]] = [get_cached_mask(key) for key in keys]
+    missing = [i for i, mask in enumerate(masks) if mask is None]
+    if missing:
+        raw_masks = _predicted_masks([working[i] for i in missing], model_name, quantized, batch_size, refine)
+        for i, raw_mask in zip(missing, raw_masks):
+            start = time.perf_counter()
+            mask = matte_edges(working[i][1], raw_mask)
+            matting_times[i] = time.perf_counter() - start
+            put_cached_mask(keys[i], mask)
+            masks[i] = mask
+    return masks, matting_times  # type: ignore
+
+# Encode the small display copy of a result; PNG keeps the transparency of cutouts
+def encode_preview(img: Image.Image) -> bytes:
+    preview_stream = io.BytesIO()
+    preview = make_preview(img)
+    if img.mode == "RGBA":
+        preview.save(preview_stream, format="PNG")
+    else:
+        preview.save(preview_stream, format="JPEG", quality=85)
+    return preview_stream.getvalue()
+
+# Composite stage: runs only for results missing from the result cache, which is keyed by output_id
+def process_image(output_id: str, bg_option: str, background_fingerprint: Optional[tuple], background_color: Optional[Tuple[int, int, int]], style_choice: str, studio_spec: Optional[Tuple[str, str, Optional[str]]], output_options: Dict[str, Any], image: Image.Image, selected_background: Optional[Image.Image], mask: Image.Image) -> Tuple[str, bytes, bytes]:
+    if bg_option != "Remove Only":
+        background = selected_background
+        if background_fingerprint and background_fingerprint[0] == "preset":
+            # Presets are composited from a pre-decoded variant already fitted to this photo's size
+            background = fit_preset(background_fingerprint[1], image.size)
+        if studio_spec and BACKGROUNDS_MODULE_AVAILABLE:
+            # Render the studio background at this photo's size instead of resizing a fixed one
+            studio_style, studio_color, studio_hex = studio_spec
+            background = generate_background(studio_style, studio_color, studio_hex, size=image.size)
+        final_image = replace_background(image, mask, background, background_color)
+    else:
+        final_image = cutout_with_mask(image, mask)
+    
+    # Encode with the selected output settings (this runs on the pipeline's worker threads)
+    output_data, file_extension = encode_image(final_image, output_options)
+    
+    base_name = "processed"
+    style_name = style_choice.lower().replace(" ", "_")
+    # Content-addressed name: the same input and settings always give the same file
+    filename = f"{bg_option.lower().replace(' ', '_')}_{style_name}_{base_name}_{output_id}.{file_extension}"
+    
+    # Cache only encoded artifacts: the download bytes and a small preview, never the decoded frame
+    return filename, output_data, encode_preview(final_image)
+
+# Results of the batch on screen, pinned in the session by output id so its downloads never expire
+# while it is shown; they are the same bytes objects the result cache holds, not copies
+def batch_result(output_id: str) -> Optional[Tuple[str, bytes, bytes, bytes]]:
+    return st.session_state.get("batch_results", {}).get(output_id)
+
+# Download controls fetch results from the session only when clicked, so the page carries no
+# file data up front; clicking reruns just the fragment, not the whole batch
+@st.fragment
+def download_control(label: str, output_id: str, key: str) -> None:
+    if st.button(label, key=f"prepare_{key}"):
+        result = batch_result(output_id)
+        if result is None:
+            st.warning("This image is no longer part of the current batch.")
+            return
+        filename, data = result[:2]
+        st.download_button(
+            label=f"Save file ({len(data) / 1024:.0f} KB)",
+            data=data,
+            file_name=filename,
+            mime=mime_type(filename),
+            key=f"save_{key}",
+            on_click="ignore",
+            type="primary"
+        )
+
+@st.fragment
+def full_size_control(output_id: str, key: str) -> None:
+    # The full-resolution result is sent to the browser only when asked for
+    if st.button("View full size", key=f"expand_{key}"):
+        result = batch_result(output_id)
+        if result is None:
+            st.warning("This image is no longer part of the current batch.")
+            return
+        st.image(result[1])
+
+@st.fragment
+def archive_control(output_ids: List[str]) -> None:
+    if st.button("Download All Images as ZIP", key="prepare_zip"):
+        # Build the ZIP only on request, streaming members from the session's batch
+        archive = StreamingArchive()
+        try:
+            for output_id in output_ids:
+                result = batch_result(output_id)
+                if result is None:
+                    st.warning("The batch changed; download the images again from the current results.")
+                    return
+                archive.add(result[0], result[1])
+            st.download_button(
+                label="Save processed_images.zip",
+                data=archive.finish(),
+                file_name="processed_images.zip",
+                mime="application/zip",
+                key="download_zip",
+                on_click="ignore",
+                type="primary"
+            )
+        finally:
+            archive.close()
 
 # Process images
 if images:
@@ -958,63 +1172,147 @@ if images:
     processed_images = []
     
     with st.spinner("Processing images..."):
-        for idx, image in enumerate(images):
-            try:
-                # Validate image file before processing
-                stream = io.BytesIO(image.read())
-                stream.seek(0)
-                Image.open(stream).verify()  # Verify image is valid
-                stream.seek(0)  # Reset stream position after verification
-                
-                # Use selected_background directly, as cache is cleared on changes
-                filename, img_data, final_image = process_image(
-                    stream.read(), max_width, bg_option, selected_background, background_color, style_choice
-                )
-                
-                st.markdown(f"#### Image {idx + 1}: {image.name}")
-                col1, col2 = st.columns([1, 1])
-                
-                with col1:
-                    st.markdown("**Original**")
-                    stream.seek(0)  # Reset stream for original image display
-                    with Image.open(stream) as orig_img:
-                        if max_width:
-                            ratio = max_width / orig_img.width
-                            new_height = int(orig_img.height * ratio)
-                            orig_img = orig_img.resize((max_width, new_height), Image.Resampling.LANCZOS)
-                        st.image(orig_img, width=400)
-                
-                with col2:
-                    st.markdown("**Processed**")
-                    st.image(final_image, width=400)
+        # Check every upload's header against the size limits up front; decoding happens once, in the pipeline
+        uploads = []
+        images_data = [image.getvalue() for image in images]
+        for idx, (image, image_data, (error, max_pixels, notice)) in enumerate(zip(images, images_data, validate_batch(images_data))):
+            if error is not None:
+                st.error(f"Image {idx + 1} ({image.name}) was rejected: {str(error)}.")
+                continue
+            if notice:
+                st.warning(f"Image {idx + 1} ({image.name}) was {notice}.")
+            uploads.append((idx, image, image_data, content_hash(image_data), max_pixels))
+        
+        # Identical uploads are processed once; their copies reuse the result
+        unique_uploads = []
+        copies: Dict[str, List[int]] = {}
+        for pos, upload in enumerate(uploads):
+            if upload[3] not in copies:
+                copies[upload[3]] = []
+                unique_uploads.append(upload)
+            copies[upload[3]].append(pos)
+        
+        # Only the current page of the gallery gets widgets; every upload is still processed for the downloads
+        page_count = max(1, -(-len(uploads) // GALLERY_PAGE_SIZE))
+        if page_count > 1:
+            if st.session_state.get("gallery_page", 1) > page_count:
+                st.session_state["gallery_page"] = page_count
+            page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, step=1, key="gallery_page")
+        else:
+            page = 1
+        page_start = (page - 1) * GALLERY_PAGE_SIZE
+        page_end = page_start + GALLERY_PAGE_SIZE
+        off_page_errors = st.container()
+        
+        # Every setting that changes the output; with the image hash it gives each result its id
+        result_params = (
+            max_width, bg_option, background_fingerprint, background_color, style_choice, studio_spec,
+            model_name, quantized, refine, edge_matting, tuple(sorted(output_options.items()))
+        )
+        output_ids = {upload[3]: result_id(upload[3], result_params) for upload in unique_uploads}
+        
+        # Finished results are looked up before anything is decoded or segmented; only misses enter the pipeline.
+        # The session pins exactly the current batch, replacing the previous one as results arrive
+        pinned_results = st.session_state.get("batch_results", {})
+        session_results: Dict[str, Tuple[str, bytes, bytes, bytes]] = {}
+        st.session_state["batch_results"] = session_results
+        cached_results = []
+        pending_uploads = []
+        for upload in unique_uploads:
+            result = pinned_results.get(output_ids[upload[3]]) or get_cached_result(output_ids[upload[3]])
+            if result is None:
+                pending_uploads.append(upload)
+            else:
+                cached_results.append((upload, result))
+        
+        # Segment chunks of uploads and composite/encode finished ones concurrently;
+        # each card on this page is filled into its own placeholder as soon as it completes
+        cards = {pos: st.container() for pos in range(page_start, min(page_end, len(uploads)))}
+        completed = len(images) - len(uploads)
+        progress_bar.progress(completed / len(images))
+        script_ctx = get_script_run_ctx()
+        
+        # Each upload is decoded once into (hash, working image, encoded thumbnail) shared by all later stages
+        def decode_upload(upload: Tuple[int, object, bytes, str, Optional[int]]) -> Tuple[str, Image.Image, bytes]:
+            working_image = load_working_image(upload[2], max_width, upload[4])
+            return upload[3], working_image, encode_preview(working_image)
+        
+        # Each mask travels with the seconds spent matting it in this run
+        def segment_uploads(chunk: List[Tuple[str, Image.Image, bytes]]) -> List[Tuple[Image.Image, Optional[float]]]:
+            masks, matting_times = segment_images(
+                [(image_hash, working_image) for image_hash, working_image, _ in chunk], model_name, quantized, inference_batch_size, refine, edge_matting
+            )
+            return list(zip(masks, matting_times))
+        
+        # Results are (filename, output bytes, processed preview, original preview); the matting time is
+        # returned beside the result, not cached with it, so it is only shown when matting ran in this run
+        def finish_upload(decoded: Tuple[str, Image.Image, bytes], segmented: Tuple[Image.Image, Optional[float]]) -> Tuple[Tuple[str, bytes, bytes, bytes], Optional[float]]:
+            image_hash, working_image, preview = decoded
+            mask, matting_time = segmented
+            output_id = output_ids[image_hash]
+            filename, output_data, result_preview = process_image(
+                output_id, bg_option, background_fingerprint, background_color, style_choice, studio_spec,
+                output_options, working_image, selected_background, mask
+            )
+            result = (filename, output_data, result_preview, preview)
+            put_cached_result(output_id, result)
+            return result, matting_time
+        
+        def batch_results() -> Iterator[Tuple[tuple, Optional[tuple], Optional[float], Optional[Exception]]]:
+            for upload, result in cached_results:
+                yield upload, result, None, None
+            results = run_pipeline(
+                pending_uploads, segment_uploads, finish_upload,
+                batch_size=inference_batch_size,
+                workers=pipeline_workers,
+                initializer=lambda: add_script_run_ctx(threading.current_thread(), script_ctx),
+                prepare=decode_upload
+            )
+            for pending_pos, outcome, error in results:
+                result, matting_time = outcome if error is None else (None, None)
+                yield pending_uploads[pending_pos], result, matting_time, error
+        
+        for upload, result, matting_time, error in batch_results():
+            first_pos = copies[upload[3]][0]
+            for pos in copies[upload[3]]:
+                idx, image = uploads[pos][:2]
+                completed += 1
+                progress_bar.progress(completed / len(images))
+                if error is not None:
+                    with cards.get(pos, off_page_errors):
+                        # Only decode failures point at the file; later stages report their own errors as-is
+                        if isinstance(error, (OSError, UploadRejected)):
+                            st.error(f"Error processing image {idx + 1}: {str(error)}. Please ensure the image is a valid PNG, JPG, JPEG, or WEBP file.")
+                        else:
+                            st.error(f"Error processing image {idx + 1}: {str(error)}")
+                    continue
+                filename, img_data, result_preview, preview = result
+                if pos == first_pos:
+                    session_results[output_ids[upload[3]]] = result
+                    processed_images.append(output_ids[upload[3]])
+                if pos not in cards:
+                    continue
+                with cards[pos]:
+                    st.markdown(f"#### Image {idx + 1}: {image.name}")
+                    if pos != first_pos:
+                        st.caption(f"Same as image {uploads[first_pos][0] + 1}; processed once")
+                    col1, col2 = st.columns([1, 1])
                     
-                    st.download_button(
-                        label=f"Download Image {idx + 1}",
-                        data=img_data,
-                        file_name=filename,
-                        mime="image/jpeg" if bg_option != "Remove Only" else "image/png",
-                        key=f"download_{idx}_{uuid.uuid4()}"
-                    )
-                
-                processed_images.append((filename, img_data))
-                progress_bar.progress((idx + 1) / len(images))
-            
-            except Exception as e:
-                st.error(f"Error processing image {idx + 1}: {str(e)}. Please ensure the image is a valid PNG, JPG, JPEG, or WEBP file.")
-    
+                    with col1:
+                        st.markdown("**Original**")
+                        st.image(preview, width=PREVIEW_WIDTH)
+                    
+                    with col2:
+                        st.markdown("**Processed**")
+                        st.image(result_preview, width=PREVIEW_WIDTH)
+                        if matting_time is not None:
+                            st.caption(f"Edge matting: {matting_time:.2f}s")
+                        
+                        download_control(f"Download Image {idx + 1}", output_ids[upload[3]], f"{idx}_{filename}")
+                        full_size_control(output_ids[upload[3]], f"{idx}_{filename}")
+        
     if len(processed_images) > 1:
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for filename, img_data in processed_images:
-                zip_file.writestr(filename, img_data)
-        zip_buffer.seek(0)
-        st.download_button(
-            label="Download All Images as ZIP",
-            data=zip_buffer.getvalue(),
-            file_name="processed_images.zip",
-            mime="application/zip",
-            key=f"download_zip_{uuid.uuid4()}"
-        )
+        archive_control(processed_images)
     
     st.markdown('</div>', unsafe_allow_html=True)
 
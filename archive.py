@@ -0,0 +1,92 @@
+import io
+import os
+import tempfile
+import zipfile
+from typing import BinaryIO, Optional, Set
+from settings import get_setting
+
+# Archives stay in memory up to this size, then spill to a temporary file
+ARCHIVE_SPOOL_BYTES = get_setting("archive", "spool_bytes", 64 * 1024 * 1024)
+
+# Members in these formats are already compressed, so deflating them only costs CPU
+STORED_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+class _SpoolingBuffer:
+    """Seekable write target for ZipFile, kept in memory until it outgrows spool_bytes"""
+
+    def __init__(self, spool_bytes: int):
+        self.spool_bytes = spool_bytes
+        self.file: BinaryIO = io.BytesIO()
+        self.rolled_over = False
+
+    def write(self, data: bytes) -> int:
+        if not self.rolled_over and self.file.tell() + len(data) > self.spool_bytes:
+            self._roll_over()
+        return self.file.write(data)
+
+    def _roll_over(self) -> None:
+        """Move the buffered bytes to a temporary file, keeping the write position"""
+        position = self.file.tell()
+        spilled = tempfile.TemporaryFile()
+        with self.file.getbuffer() as buffered:  # type: ignore
+            spilled.write(buffered)
+        spilled.seek(position)
+        self.file.close()
+        self.file = spilled  # type: ignore
+        self.rolled_over = True
+
+    def tell(self) -> int:
+        return self.file.tell()
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self.file.seek(offset, whence)
+
+    def seekable(self) -> bool:
+        return True
+
+    def flush(self) -> None:
+        self.file.flush()
+
+class StreamingArchive:
+    """ZIP archive that members are appended to as they finish, spooled to disk when large"""
+
+    def __init__(self, spool_bytes: int = ARCHIVE_SPOOL_BYTES):
+        self._buffer = _SpoolingBuffer(spool_bytes)
+        self._zip = zipfile.ZipFile(self._buffer, "w")  # type: ignore
+        self._names: Set[str] = set()
+        self._reader: Optional[io.FileIO] = None
+
+    def add(self, filename: str, data: bytes) -> bool:
+        """Append one member; a name that is already present is skipped (identical outputs share a name)"""
+        if filename in self._names:
+            return False
+        extension = os.path.splitext(filename)[1].lower()
+        compression = zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+        self._zip.writestr(filename, data, compress_type=compression)
+        self._names.add(filename)
+        return True
+
+    def finish(self) -> BinaryIO:
+        """
+        Write the central directory and return the archive for reading without copying it
+
+        Small archives come back as their in-memory buffer; spooled ones as a
+        raw reader over the temporary file (consumers such as Streamlit accept
+        raw files but not read-write buffered ones), so the only full copy
+        made is the one the consumer reads.
+        """
+        self._zip.close()
+        if not self._buffer.rolled_over:
+            self._buffer.file.seek(0)
+            return self._buffer.file
+        self._buffer.flush()
+        self._reader = io.FileIO(os.dup(self._buffer.file.fileno()), "rb")
+        self._reader.seek(0)
+        return self._reader  # type: ignore
+
+    def close(self) -> None:
+        """Discard the archive and its temporary file"""
+        self._zip.close()
+        if self._reader is not None:
+            self._reader.close()
+        self._buffer.file.close()
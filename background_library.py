@@ -0,0 +1,159 @@
+from PIL import Image
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from settings import get_setting
+from lru import BoundedLRU, image_nbytes
+
+# Preset background folder; relative paths resolve next to the app
+BACKGROUND_DIR = get_setting("backgrounds", "directory", "backgrounds")
+if not os.path.isabs(BACKGROUND_DIR):
+    BACKGROUND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), BACKGROUND_DIR)
+BACKGROUND_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+# Longest sides of the decoded copies built for a preset the first time it is composited; composites resize from
+# the smallest one that covers the photo, and photos larger than every copy are fitted by upscaling the largest
+_variant_sizes = get_setting("backgrounds", "variant_sizes", [768, 1536, 3072])
+if isinstance(_variant_sizes, str):
+    _variant_sizes = [int(size) for size in _variant_sizes.split(",") if size.strip()]
+VARIANT_SIZES: List[int] = sorted(int(size) for size in _variant_sizes)
+THUMBNAIL_WIDTH = get_setting("backgrounds", "thumbnail_width", 200)
+VARIANT_MAX_ENTRIES = get_setting("backgrounds", "variant_entries", 4)
+VARIANT_MAX_BYTES = get_setting("backgrounds", "variant_max_bytes", 256 * 1024 * 1024)
+FITTED_MAX_ENTRIES = get_setting("backgrounds", "fitted_entries", 16)
+FITTED_MAX_BYTES = get_setting("backgrounds", "fitted_max_bytes", 256 * 1024 * 1024)
+
+class PresetBackground(NamedTuple):
+    name: str
+    path: str
+    mtime: float
+    size: Tuple[int, int]
+    thumbnail: bytes
+
+_library: Dict[str, PresetBackground] = {}
+_library_lock = threading.Lock()
+_variants = BoundedLRU(VARIANT_MAX_ENTRIES, VARIANT_MAX_BYTES, lambda variants: sum(image_nbytes(v) for v in variants.values()))
+_variants_lock = threading.Lock()
+_fitted = BoundedLRU(FITTED_MAX_ENTRIES, FITTED_MAX_BYTES, image_nbytes)
+
+def _scaled_size(size: Tuple[int, int], longest: int) -> Tuple[int, int]:
+    """Size with the given longest side, keeping the aspect ratio"""
+    scale = longest / max(size)
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+def _decode(path: str, target: Optional[Tuple[int, int]] = None) -> Image.Image:
+    """Decode a background to RGB, at reduced JPEG scale when a smaller target is given"""
+    with Image.open(path) as img:
+        if target is not None:
+            img.draft("RGB", target)
+        return img.convert("RGB")
+
+def _index_entry(name: str, path: str, mtime: float) -> PresetBackground:
+    """Read a preset's size and encode its thumbnail, decoding at reduced JPEG scale where possible"""
+    with Image.open(path) as img:
+        size = img.size
+        # The thumbnail box is capped by width except for very tall presets, so drafting to twice the width
+        # keeps PIL's reducing gap while letting large JPEGs decode at 1/8 scale
+        img.draft("RGB", (THUMBNAIL_WIDTH * 2, 1))
+        img.thumbnail((THUMBNAIL_WIDTH, THUMBNAIL_WIDTH * 4), Image.Resampling.BILINEAR, reducing_gap=2.0)
+        thumbnail = img.convert("RGB")
+    stream = io.BytesIO()
+    thumbnail.save(stream, format="JPEG", quality=85)
+    return PresetBackground(name, path, mtime, size, stream.getvalue())
+
+def _build_variants(preset: PresetBackground) -> Dict[int, Image.Image]:
+    """Decode a preset once and derive its resized variants, keyed by longest side"""
+    size = preset.size
+    path = preset.path
+    variant_sizes = [longest for longest in VARIANT_SIZES if longest < max(size)]
+    keep_source = not VARIANT_SIZES or max(size) <= VARIANT_SIZES[-1]
+
+    # A preset no larger than the biggest variant is kept at full size; otherwise it is decoded at reduced
+    # JPEG scale just large enough for the biggest variant
+    source = _decode(path, None if keep_source else _scaled_size(size, variant_sizes[-1]))
+    variants: Dict[int, Image.Image] = {}
+    if keep_source:
+        variants[max(source.size)] = source
+
+    # Largest variant first, each smaller one resampled from the previous to keep the one-off build cheap
+    previous = source
+    for longest in reversed(variant_sizes):
+        previous = variants[longest] = previous.resize(_scaled_size(size, longest), Image.Resampling.LANCZOS)
+    return variants
+
+def preset_variants(preset: PresetBackground) -> Dict[int, Image.Image]:
+    """Resized variants of a preset, built on first use and kept in a bounded LRU keyed by name and mtime"""
+    key = (preset.name, preset.mtime)
+    variants = _variants.get(key)
+    if variants is not None:
+        return variants
+    # Composites of one batch run on several workers; only the first builds, the rest wait for its result
+    with _variants_lock:
+        variants = _variants.get(key)
+        if variants is None:
+            variants = _build_variants(preset)
+            _variants.put(key, variants)
+    return variants
+
+def preset_library() -> List[PresetBackground]:
+    """
+    Current preset backgrounds, sorted by name
+
+    The folder is re-listed on every call, which only costs a stat per file;
+    only new or modified presets are read again, and only for their size and
+    thumbnail. Full-size variants are built lazily by preset_variants.
+    """
+    if not os.path.isdir(BACKGROUND_DIR):
+        return []
+    found = {}
+    with os.scandir(BACKGROUND_DIR) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith(BACKGROUND_EXTENSIONS):
+                found[entry.name] = (entry.path, entry.stat().st_mtime)
+    with _library_lock:
+        for name in list(_library):
+            if name not in found:
+                del _library[name]
+        stale = [(name, path, mtime) for name, (path, mtime) in found.items() if name not in _library or _library[name].mtime != mtime]
+        if stale:
+            # Decoding releases the GIL, so new presets are indexed in parallel
+            with ThreadPoolExecutor(max_workers=min(len(stale), os.cpu_count() or 1)) as executor:
+                for entry in executor.map(lambda item: _index_entry(*item), stale):
+                    _library[entry.name] = entry
+        return [_library[name] for name in sorted(_library)]
+
+def get_preset(name: str) -> Optional[PresetBackground]:
+    """Indexed preset by file name, or None when it is not in the library"""
+    with _library_lock:
+        return _library.get(name)
+
+def fit_preset(name: str, size: Tuple[int, int]) -> Image.Image:
+    """
+    Preset background resized to a photo's size
+
+    Args:
+        name (str): Preset file name
+        size (tuple): (width, height) of the photo
+
+    Returns:
+        PIL.Image: RGB background of exactly that size
+    """
+    preset = get_preset(name)
+    if preset is None:
+        raise ValueError(f"Preset background {name} is no longer available")
+    key = (name, preset.mtime, tuple(size))
+    fitted = _fitted.get(key)
+    if fitted is not None:
+        return fitted
+
+    # Smallest decoded variant covering the photo; larger photos are upscaled from the largest one
+    variants = preset_variants(preset)
+    for longest in sorted(variants):
+        variant = variants[longest]
+        if variant.width >= size[0] and variant.height >= size[1]:
+            break
+    fitted = variant if variant.size == tuple(size) else variant.resize(size, Image.Resampling.LANCZOS)
+    _fitted.put(key, fitted)
+    return fitted
@@ -1,6 +1,8 @@
 from PIL import Image, ImageDraw, ImageFilter
 import numpy as np
-from typing import Any, Tuple
+from typing import Any, Optional, Tuple
+from settings import get_setting
+from lru import BoundedLRU, image_nbytes
 
 # Preset colors for studio backgrounds
 COLOR_MAP = {
@@ -21,135 +23,227 @@ COLOR_MAP = {
     "Orange": (255, 165, 0)
 }
 
+# Downscale factor for the blurred vignette mask
+VIGNETTE_MASK_SCALE = 4
+
+# Size the effect parameters (blur radii, bokeh sizes) were tuned at; other
+# sizes scale them so any aspect ratio or a small preview keeps the same look
+REFERENCE_SIZE = (800, 1000)
+
+# Width of the low-resolution studio preview shown in the app
+PREVIEW_WIDTH = 200
+
+# Process-wide background cache limits (shared across Streamlit sessions)
+BACKGROUND_CACHE_MAX_ENTRIES = get_setting("backgrounds", "cache_max_entries", 32)
+BACKGROUND_CACHE_MAX_BYTES = get_setting("backgrounds", "cache_max_bytes", 256 * 1024 * 1024)
+
+_background_cache = BoundedLRU(BACKGROUND_CACHE_MAX_ENTRIES, BACKGROUND_CACHE_MAX_BYTES, image_nbytes)
+
 def hex_to_rgb(hex_color: str) -> Tuple[int, int, int]:
     """Convert hex color to RGB tuple"""
     hex_color = hex_color.lstrip('#')
     return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
 
-def add_noise(image: Image.Image, amount: int = 6) -> Image.Image:
-    """Add subtle noise to image for realistic texture"""
-    arr = np.array(image, dtype=np.int16)
-    noise = np.random.randint(-amount, amount + 1, arr.shape, dtype=np.int16)
-    arr = np.clip(arr + noise, 0, 255).astype(np.uint8)
-    return Image.fromarray(arr)
+# Studio styles render into float32 (3, h, w) channel planes holding whole levels, apply their effects
+# in place and convert to an image once at the end
+
+def _image_planes(image: Image.Image) -> np.ndarray:
+    """Channel planes of an RGB image"""
+    return np.array(image.convert('RGB'), dtype=np.float32).transpose(2, 0, 1)
+
+def _planes_image(planes: np.ndarray, mask: Optional[np.ndarray] = None) -> Image.Image:
+    """Merge channel planes into an RGB image, darkened by a 0..1 mask when given (planes are modified)"""
+    # Contiguous 8-bit planes merged by PIL interleave faster than strided writes into an RGB array
+    out = np.empty(planes.shape, dtype=np.uint8)
+    for plane, channel in zip(planes, out):
+        if mask is None:
+            channel[...] = plane
+        else:
+            # Round while converting to 8 bits
+            plane *= mask
+            np.add(plane, np.float32(0.5), out=channel, casting='unsafe')
+    return Image.merge('RGB', [Image.fromarray(channel) for channel in out])
+
+def _add_noise_planes(planes: np.ndarray, amount: int, seed: Optional[int] = None) -> None:
+    """Add uniform integer noise in [-amount, amount] to channel planes in place, clipped to 0..255"""
+    # One random byte per sample, read straight from the bit generator and mapped onto
+    # 2 * amount + 1 levels by a multiply and shift in 16-bit integers
+    samples = planes[0].size
+    raw = np.random.default_rng(seed).bit_generator.random_raw(-(-3 * samples // 8)).view(np.uint8)
+    noise = np.empty(planes.shape[1:], dtype=np.uint16)
+    for c, plane in enumerate(planes):
+        np.multiply(raw[c * samples:(c + 1) * samples].reshape(plane.shape), 2 * amount + 1, out=noise, dtype=np.uint16)
+        noise >>= 8
+        plane += noise
+    planes -= amount
+    np.clip(planes, 0, 255, out=planes)
+
+def _upsample_rows(a: np.ndarray, scale: int, rows: int) -> np.ndarray:
+    """Bilinear upsampling along the first axis by an integer factor, with edges clamped as in PIL"""
+    n = a.shape[0]
+    padded = np.concatenate([a[:1], a, a[-1:]])
+    step = padded[1:] - padded[:-1]
+    out = np.empty((n * scale,) + a.shape[1:], dtype=np.float32)
+    # With an integer factor the interpolation weights repeat every scale rows, so each phase
+    # is a shifted slice plus a fixed fraction of the step to the next row
+    for k in range(scale):
+        offset = (k + 0.5) / scale - 0.5
+        first = 0 if offset < 0 else 1
+        phase = out[k::scale]
+        np.multiply(step[first:first + n], np.float32(offset % 1), out=phase)
+        phase += padded[first:first + n]
+    return out[:rows]
+
+def _vignette_mask(size: Tuple[int, int], blur: int, darkness: float) -> np.ndarray:
+    """0..1 vignette mask: a blurred ellipse reaching past the edges by darkness times the mean side"""
+    w, h = size
+    max_r = int((w + h) / 2 * darkness)
+    # The blurred mask is smooth, so draw and blur it at reduced scale, then upsample
+    scale = max(1, min(VIGNETTE_MASK_SCALE, blur // 8, min(w, h) // 32))
+    sw, sh = -(-w // scale), -(-h // scale)
+    mask = Image.new('L', (sw, sh), 0)
+    draw = ImageDraw.Draw(mask)
+    draw.ellipse(((-max_r) / scale, (-max_r) / scale, (w + max_r) / scale, (h + max_r) / scale), fill=255)
+    mask = mask.filter(ImageFilter.GaussianBlur(blur / scale))
+    small = np.asarray(mask, dtype=np.float32) * np.float32(1 / 255)
+    if scale == 1:
+        return small
+    # Columns first, while the mask is still short, then rows on contiguous memory
+    return _upsample_rows(np.ascontiguousarray(_upsample_rows(small.T, scale, w).T), scale, h)
+
+def add_noise(image: Image.Image, amount: int = 6, seed: Optional[int] = None) -> Image.Image:
+    """Add subtle noise to image for realistic texture (deterministic when seed is given)"""
+    planes = _image_planes(image)
+    _add_noise_planes(planes, amount, seed)
+    return _planes_image(planes)
 
 def add_vignette(image: Image.Image, blur: int = 120, darkness: float = 0.5) -> Image.Image:
     """Add vignette effect to image"""
-    w, h = image.size
-    mask = Image.new('L', (w, h), 0)
-    draw = ImageDraw.Draw(mask)
-    max_r = int((w + h) / 2 * darkness)
-    draw.ellipse((-max_r, -max_r, w + max_r, h + max_r), fill=255)
-    mask = mask.filter(ImageFilter.GaussianBlur(blur))
-    return Image.composite(image, Image.new('RGB', (w, h), (0, 0, 0)), mask)  # type: ignore
+    return _planes_image(_image_planes(image), _vignette_mask(image.size, blur, darkness))
 
-def add_bokeh(image: Image.Image, count: int = 12, max_radius: int = 80, opacity: int = 50) -> Image.Image:
-    """Add bokeh light effects to image"""
+def add_bokeh(image: Image.Image, count: int = 12, max_radius: int = 80, opacity: int = 50, seed: Optional[int] = None, min_radius: int = 20) -> Image.Image:
+    """Add bokeh light effects to image (deterministic when seed is given)"""
+    rng = np.random.default_rng(seed)
     draw = ImageDraw.Draw(image, 'RGBA')
     w, h = image.size
+    max_radius = max(max_radius, min_radius + 1)
     for _ in range(count):
-        x, y = np.random.randint(0, w), np.random.randint(0, h)
-        r = np.random.randint(20, max_radius)
+        x, y = int(rng.integers(0, w)), int(rng.integers(0, h))
+        r = int(rng.integers(min_radius, max_radius))
         draw.ellipse((x - r, y - r, x + r, y + r), fill=(255, 255, 255, opacity))
     return image
 
+# Vectorized gradient engine
+
+def _effect_scale(size: Tuple[int, int]) -> float:
+    """Scale factor for pixel-sized effect parameters relative to REFERENCE_SIZE"""
+    return ((size[0] * size[1]) / (REFERENCE_SIZE[0] * REFERENCE_SIZE[1])) ** 0.5
+
+def _scaled(value: int, size: Tuple[int, int]) -> int:
+    """Scale a pixel-sized effect parameter to the target size"""
+    return max(1, int(round(value * _effect_scale(size))))
+
+def _radial_ratio(size: Tuple[int, int], center: Tuple[int, int], max_r: float) -> np.ndarray:
+    """Distance from center as a 0..1 ratio field, computed once via broadcasting"""
+    w, h = size
+    dx = (np.arange(w, dtype=np.float32) - np.float32(center[0])) / np.float32(max_r)
+    dy = (np.arange(h, dtype=np.float32) - np.float32(center[1])) / np.float32(max_r)
+    ratio = np.add.outer(dy * dy, dx * dx)
+    np.sqrt(ratio, out=ratio)
+    return np.minimum(ratio, np.float32(1), out=ratio)
+
+def _vertical_ratio(size: Tuple[int, int]) -> np.ndarray:
+    """Top-to-bottom 0..1 ratio column, broadcast across the width on blend"""
+    return (np.arange(size[1], dtype=np.float32) / np.float32(size[1]))[:, None]
+
+def _blend_gradient(color: Tuple[int, int, int], target: Any, ratio: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """Blend color toward target by ratio into channel planes, truncated to whole levels"""
+    w, h = size
+    planes = np.empty((3, h, w), dtype=np.float32)
+    target = np.asarray(target, dtype=np.float32)
+    # color + (target - color) * ratio, one plane at a time without temporaries
+    for c, plane in enumerate(planes):
+        t = target[c] if target.ndim == 1 else target
+        if t.ndim:
+            np.subtract(t, np.float32(color[c]), out=plane)
+            plane *= ratio
+        else:
+            np.multiply(ratio, t - np.float32(color[c]), out=plane)
+        plane += np.float32(color[c])
+    return np.floor(planes, out=planes)
+
+def linear_gradient_bg(color1: Tuple[int, int, int], color2: Tuple[int, int, int], size: Tuple[int, int] = (800, 600)) -> Image.Image:
+    """Create a vertical two-color gradient background"""
+    return _planes_image(_blend_gradient(color1, color2, _vertical_ratio(size), size))
+
+def dot_pattern_bg(base: Tuple[int, int, int], dot: Tuple[int, int, int], size: Tuple[int, int] = (800, 600), spacing: int = 50, dot_size: int = 20) -> Image.Image:
+    """Create a dotted pattern background by tiling a single rendered cell"""
+    cell = Image.new('RGB', (spacing, spacing), color=base)  # type: ignore
+    ImageDraw.Draw(cell).ellipse([0, 0, dot_size, dot_size], fill=dot)
+    w, h = size
+    reps = (-(-h // spacing), -(-w // spacing), 1)
+    arr = np.tile(np.asarray(cell), reps)[:h, :w]
+    return Image.fromarray(np.ascontiguousarray(arr), 'RGB')
+
 # Studio Background Styles
 
-def solid_color_bg(color: Tuple[int, int, int], size: Tuple[int, int] = (800, 1000)) -> Image.Image:
+def solid_color_bg(color: Tuple[int, int, int], size: Tuple[int, int] = (800, 1000), seed: Optional[int] = None) -> Image.Image:
     """Create a flat solid color background"""
     return Image.new('RGB', size, color=color)  # type: ignore
 
-def passport_studio_bg(color: Tuple[int, int, int], size: Tuple[int, int] = (413, 531)) -> Image.Image:
+def passport_studio_bg(color: Tuple[int, int, int], size: Tuple[int, int] = (413, 531), seed: Optional[int] = None) -> Image.Image:
     """Create passport-style studio background with subtle gradient and effects"""
-    img = Image.new('RGB', size, color=color)  # type: ignore
     cx, cy = size[0] // 2, size[1] // 2
     max_r = max(size) // 1.2
-    px: Any = img.load()
     
     # Create radial gradient
-    for y in range(size[1]):
-        for x in range(size[0]):
-            dx, dy = x - cx, y - cy
-            dist = (dx*dx + dy*dy) ** 0.5
-            ratio = min(dist / max_r, 1)
-            r = int(color[0] * (1 - ratio) + 255 * ratio * 0.18)
-            g = int(color[1] * (1 - ratio) + 255 * ratio * 0.18)
-            b = int(color[2] * (1 - ratio) + 255 * ratio * 0.18)
-            px[x, y] = (r, g, b)
+    ratio = _radial_ratio(size, (cx, cy), max_r)
+    planes = _blend_gradient(color, 255 * 0.18, ratio, size)
     
     # Add effects
-    img = add_noise(img, amount=5)
-    img = add_vignette(img, blur=80, darkness=0.5)
-    return img
+    _add_noise_planes(planes, amount=5, seed=seed)
+    return _planes_image(planes, _vignette_mask(size, blur=_scaled(80, size), darkness=0.5))
 
-def portrait_studio_bg(color: Tuple[int, int, int], size: Tuple[int, int] = (800, 1000)) -> Image.Image:
+def portrait_studio_bg(color: Tuple[int, int, int], size: Tuple[int, int] = (800, 1000), seed: Optional[int] = None) -> Image.Image:
     """Create portrait studio background with vertical gradient and professional effects"""
-    img = Image.new('RGB', size, color=color)  # type: ignore
-    px: Any = img.load()
-    
     # Create vertical gradient
-    for y in range(size[1]):
-        ratio = y / size[1]
-        r = int(color[0] * (1 - ratio) + 235 * ratio)
-        g = int(color[1] * (1 - ratio) + 235 * ratio)
-        b = int(color[2] * (1 - ratio) + 235 * ratio)
-        for x in range(size[0]):
-            px[x, y] = (r, g, b)
+    planes = _blend_gradient(color, 235, _vertical_ratio(size), size)
     
     # Add professional effects
-    img = add_noise(img, amount=7)
-    img = add_vignette(img, blur=120, darkness=0.38)
-    img = add_bokeh(img, count=12, max_radius=80, opacity=55)
+    _add_noise_planes(planes, amount=7, seed=seed)
+    img = _planes_image(planes, _vignette_mask(size, blur=_scaled(120, size), darkness=0.38))
+    img = add_bokeh(img, count=12, max_radius=_scaled(80, size), opacity=55, seed=None if seed is None else seed + 1,
+                    min_radius=_scaled(20, size))
     return img
 
-def group_studio_bg(color: Tuple[int, int, int], size: Tuple[int, int] = (1600, 900)) -> Image.Image:
+def group_studio_bg(color: Tuple[int, int, int], size: Tuple[int, int] = (1600, 900), seed: Optional[int] = None) -> Image.Image:
     """Create group photo studio background with wide format and subtle effects"""
-    img = Image.new('RGB', size, color=color)  # type: ignore
     cx, cy = size[0] // 2, size[1] // 2
     max_r = max(size) // 1.6
-    px: Any = img.load()
     
     # Create radial gradient from center
-    for y in range(size[1]):
-        for x in range(size[0]):
-            dx, dy = x - cx, y - cy
-            dist = (dx*dx + dy*dy) ** 0.5
-            ratio = min(dist / max_r, 1)
-            r = int(color[0] * (1 - ratio) + 210 * ratio)
-            g = int(color[1] * (1 - ratio) + 210 * ratio)
-            b = int(color[2] * (1 - ratio) + 210 * ratio)
-            px[x, y] = (r, g, b)
+    ratio = _radial_ratio(size, (cx, cy), max_r)
+    planes = _blend_gradient(color, 210, ratio, size)
     
     # Add subtle effects
-    img = add_noise(img, amount=6)
-    img = add_vignette(img, blur=140, darkness=0.35)
-    return img
+    _add_noise_planes(planes, amount=6, seed=seed)
+    return _planes_image(planes, _vignette_mask(size, blur=_scaled(140, size), darkness=0.35))
 
-def professional_headshot_bg(color: Tuple[int, int, int], size: Tuple[int, int] = (600, 800)) -> Image.Image:
+def professional_headshot_bg(color: Tuple[int, int, int], size: Tuple[int, int] = (600, 800), seed: Optional[int] = None) -> Image.Image:
     """Create professional headshot background with sophisticated lighting"""
-    img = Image.new('RGB', size, color=color)  # type: ignore
     cx, cy = size[0] // 2, size[1] // 3  # Focus light higher up
     max_r = max(size) // 1.8
-    px: Any = img.load()
     
     # Create sophisticated gradient
-    for y in range(size[1]):
-        for x in range(size[0]):
-            dx, dy = x - cx, y - cy
-            dist = (dx*dx + dy*dy) ** 0.5
-            ratio = min(dist / max_r, 1)
-            
-            # More sophisticated color blending
-            highlight_factor = 0.25 if ratio < 0.3 else 0.1
-            r = int(color[0] * (1 - ratio) + (255 * highlight_factor) * ratio)
-            g = int(color[1] * (1 - ratio) + (255 * highlight_factor) * ratio)
-            b = int(color[2] * (1 - ratio) + (255 * highlight_factor) * ratio)
-            px[x, y] = (r, g, b)
+    ratio = _radial_ratio(size, (cx, cy), max_r)
+    
+    # More sophisticated color blending
+    highlight_factor = np.where(ratio < 0.3, np.float32(0.25), np.float32(0.1))
+    planes = _blend_gradient(color, 255 * highlight_factor, ratio, size)
     
     # Add professional effects
-    img = add_noise(img, amount=4)
-    img = add_vignette(img, blur=100, darkness=0.45)
-    return img
+    _add_noise_planes(planes, amount=4, seed=seed)
+    return _planes_image(planes, _vignette_mask(size, blur=_scaled(100, size), darkness=0.45))
 
 # Map of available styles
 STYLE_MAP = {
@@ -160,7 +254,13 @@ STYLE_MAP = {
     "Professional Headshot": professional_headshot_bg
 }
 
-def generate_background(style: str, color_name: str = "White", custom_color_hex: str | None = None, size: Tuple[int, int] = (800, 1000)) -> Image.Image:
+def _resolve_color(color_name: str, custom_color_hex: str | None) -> Tuple[int, int, int]:
+    """Resolve a preset color name or custom hex value to an RGB tuple"""
+    if custom_color_hex:
+        return hex_to_rgb(custom_color_hex)
+    return COLOR_MAP.get(color_name, (255, 255, 255))
+
+def generate_background(style: str, color_name: str = "White", custom_color_hex: str | None = None, size: Tuple[int, int] = (800, 1000), seed: Optional[int] = 0) -> Image.Image:
     """
     Generate a professional studio background
     
@@ -168,22 +268,41 @@ def generate_background(style: str, color_name: str = "White", custom_color_hex:
         style (str): Background style from STYLE_MAP
         color_name (str): Color name from COLOR_MAP
         custom_color_hex (str): Custom hex color (optional)
-        size (tuple): Background size (width, height)
+        size (tuple): Background size (width, height); any aspect ratio is
+            rendered procedurally, so pass the photo's own size instead of resizing
+        seed (int): Seed for noise and bokeh; results are cached per
+            (style, color, size, seed). Pass None for a fresh random, uncached result
     
     Returns:
         PIL.Image: Generated background image
     """
     # Determine color
-    if custom_color_hex:
-        color = hex_to_rgb(custom_color_hex)
-    else:
-        color = COLOR_MAP.get(color_name, (255, 255, 255))
+    color = _resolve_color(color_name, custom_color_hex)
     
     # Get background generation function
-    func = STYLE_MAP.get(style, solid_color_bg)
+    if style not in STYLE_MAP:
+        style = "Solid Color"
+    func = STYLE_MAP[style]
+    size = (int(size[0]), int(size[1]))
+    
+    if seed is None:
+        return func(color, size=size)
     
-    # Generate background
-    return func(color, size=size)
+    # Serve from the shared cache; callers get a copy so they may draw on it
+    key = (style, color, size, seed)
+    img = _background_cache.get(key)
+    if img is None:
+        img = func(color, size=size, seed=seed)
+        _background_cache.put(key, img)
+    return img.copy()
+
+def preview_size(aspect: Tuple[int, int] = REFERENCE_SIZE, width: int = PREVIEW_WIDTH) -> Tuple[int, int]:
+    """Size of a low-resolution preview with the given aspect ratio"""
+    return width, max(1, round(width * aspect[1] / aspect[0]))
+
+def generate_preview(style: str, color_name: str = "White", custom_color_hex: str | None = None, aspect: Tuple[int, int] = REFERENCE_SIZE, width: int = PREVIEW_WIDTH) -> Image.Image:
+    """Render a small preview of a studio background directly at display size"""
+    return generate_background(style, color_name, custom_color_hex, size=preview_size(aspect, width))
 
 # Convenience function for getting available options
 def get_available_styles() -> list[str]:
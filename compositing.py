@@ -0,0 +1,210 @@
+from PIL import Image
+import numpy as np
+from typing import Iterator, List, Tuple, Union
+from settings import get_setting
+
+Background = Union[Image.Image, Tuple[int, int, int]]
+
+# Rows blended per tile; tile buffers stay cache-resident and are reused across the frame
+TILE_ROWS = 64
+
+# Band-limited mode classifies TILE_ROWS x TILE_COLS blocks and only blends those on the subject's edge
+TILE_COLS = 128
+BAND_LIMITED = get_setting("compositing", "band_limited", True)
+
+# Alpha at or below / at or above these counts as fully transparent / opaque
+TRANSPARENT_THRESHOLD = get_setting("compositing", "transparent_threshold", 0)
+OPAQUE_THRESHOLD = get_setting("compositing", "opaque_threshold", 255)
+
+def _div255(acc: np.ndarray, tmp: np.ndarray) -> np.ndarray:
+    """Rounded in-place division of a uint16 array by 255 using shifts only"""
+    acc += 128
+    np.right_shift(acc, 8, out=tmp)
+    acc += tmp
+    acc >>= 8
+    return acc
+
+def blend_into(out: np.ndarray, fg: np.ndarray, alpha: np.ndarray, background: Union[np.ndarray, Tuple[int, int, int]]) -> np.ndarray:
+    """
+    Alpha-blend fg over background into a preallocated RGB buffer
+
+    Computes fg * a + bg * (1 - a) in uint16 fixed point, one band of
+    TILE_ROWS rows at a time, so the only temporaries are a few tile-sized
+    buffers allocated once per call.
+
+    Args:
+        out (ndarray): HxWx3 uint8 destination (may be the background array itself)
+        fg (ndarray): HxWx3 uint8 foreground
+        alpha (ndarray): HxW uint8 alpha, 255 = foreground
+        background: HxWx3 uint8 array or an RGB color tuple
+
+    Returns:
+        ndarray: out
+    """
+    h, w = alpha.shape
+    rows = min(TILE_ROWS, h)
+    # Interleaved RGB rows viewed flat, with alpha repeated per channel, keep every op contiguous
+    fg_rows = fg.reshape(h, w * 3)
+    out_rows = out.reshape(h, w * 3)
+    solid = not isinstance(background, np.ndarray)
+    if solid:
+        bg_row = np.tile(np.asarray(background, dtype=np.uint8), w)
+    else:
+        bg_rows = background.reshape(h, w * 3)  # type: ignore
+    a3 = np.empty((rows, w * 3), dtype=np.uint8)
+    acc = np.empty((rows, w * 3), dtype=np.uint16)
+    tmp = np.empty((rows, w * 3), dtype=np.uint16)
+
+    for y in range(0, h, rows):
+        n = min(rows, h - y)
+        _blend_block(out_rows[y:y + n], fg_rows[y:y + n], alpha[y:y + n], bg_row if solid else bg_rows[y:y + n], a3, acc, tmp)
+    return out
+
+def _blend_block(out: np.ndarray, fg: np.ndarray, alpha: np.ndarray, bg: np.ndarray, a3: np.ndarray, acc: np.ndarray, tmp: np.ndarray) -> None:
+    """Blend one block of flat RGB rows using slices of the preallocated tile buffers"""
+    n, m = alpha.shape
+    a_t, acc_t, tmp_t = a3[:n, :m * 3], acc[:n, :m * 3], tmp[:n, :m * 3]
+    a_t[...] = np.repeat(alpha, 3, axis=1)
+    np.multiply(fg, a_t, out=acc_t, dtype=np.uint16)
+    np.subtract(255, a_t, out=a_t)
+    np.multiply(bg, a_t, out=tmp_t, dtype=np.uint16)
+    acc_t += tmp_t
+    out[...] = _div255(acc_t, tmp_t)
+
+def _block_runs(classes: np.ndarray) -> List[Tuple[int, int, int]]:
+    """Group consecutive blocks of the same class into (class, first block, end block) runs"""
+    bounds = np.flatnonzero(np.diff(classes)) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(classes)]))
+    return [(int(classes[s]), int(s), int(e)) for s, e in zip(starts, ends)]
+
+def _snap(alpha: np.ndarray, transparent_threshold: int, opaque_threshold: int) -> np.ndarray:
+    """Clamp near-transparent / near-opaque alpha to 0 / 255 so edge blocks agree with the bulk copies"""
+    if transparent_threshold <= 0 and opaque_threshold >= 255:
+        return alpha
+    alpha = alpha.copy()
+    alpha[alpha <= transparent_threshold] = 0
+    alpha[alpha >= opaque_threshold] = 255
+    return alpha
+
+def mask_bands(
+    alpha: np.ndarray,
+    transparent_threshold: int = TRANSPARENT_THRESHOLD,
+    opaque_threshold: int = OPAQUE_THRESHOLD
+) -> Iterator[Tuple[str, int, int, int, int]]:
+    """
+    Split a mask into opaque and edge bands; everything not yielded is transparent
+
+    Rows are taken TILE_ROWS at a time and cut into TILE_COLS wide blocks,
+    each classified by its alpha range; neighbouring blocks of the same class
+    are merged into one band.
+
+    Args:
+        alpha (ndarray): HxW uint8 alpha, usually cropped to its bounding box
+        transparent_threshold (int): Alpha at or below this is treated as 0
+        opaque_threshold (int): Alpha at or above this is treated as 255
+
+    Yields:
+        tuple: ("opaque" or "edge", x0, y0, x1, y1) in alpha coordinates
+    """
+    h, w = alpha.shape
+    if h == 0 or w == 0:
+        return
+    block_starts = np.arange(0, w, TILE_COLS)
+    for y in range(0, h, TILE_ROWS):
+        n = min(TILE_ROWS, h - y)
+        band = alpha[y:y + n]
+        # Per-block alpha range from column-wise extremes: 0 transparent, 1 opaque, 2 edge
+        lo = np.minimum.reduceat(band.min(axis=0), block_starts)
+        hi = np.maximum.reduceat(band.max(axis=0), block_starts)
+        classes = np.full(len(block_starts), 2, dtype=np.uint8)
+        classes[hi <= transparent_threshold] = 0
+        classes[lo >= opaque_threshold] = 1
+        for kind, first, end in _block_runs(classes):
+            if kind:
+                x0 = int(block_starts[first])
+                x1 = min(int(block_starts[end - 1]) + TILE_COLS, w)
+                yield "opaque" if kind == 1 else "edge", x0, y, x1, y + n
+
+def _blend_band(out: np.ndarray, fg: np.ndarray, alpha: np.ndarray, bg: np.ndarray, a3: np.ndarray, acc: np.ndarray, tmp: np.ndarray) -> None:
+    """Blend an edge band (flat RGB rows) block by block so the tile buffers can stay small"""
+    step = a3.shape[1] // 3
+    for x in range(0, alpha.shape[1], step):
+        x_end = min(x + step, alpha.shape[1])
+        bg_block = bg[x * 3:x_end * 3] if bg.ndim == 1 else bg[:, x * 3:x_end * 3]
+        _blend_block(out[:, x * 3:x_end * 3], fg[:, x * 3:x_end * 3], alpha[:, x:x_end], bg_block, a3, acc, tmp)
+
+def _band_buffers() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Tile buffers for one TILE_ROWS x TILE_COLS block"""
+    shape = (TILE_ROWS, TILE_COLS * 3)
+    return np.empty(shape, dtype=np.uint8), np.empty(shape, dtype=np.uint16), np.empty(shape, dtype=np.uint16)
+
+def _composite_bands(fg: Image.Image, alpha: Image.Image, background: Background, transparent_threshold: int, opaque_threshold: int) -> Image.Image:
+    """Band-limited composite on PIL images, only converting the edge bands to arrays"""
+    if isinstance(background, Image.Image):
+        result = background.copy()
+    else:
+        result = Image.new('RGB', fg.size, tuple(int(v) for v in background[:3]))  # type: ignore
+
+    # The bounding box comes from PIL so the full-frame mask is never copied into NumPy
+    visible = alpha if transparent_threshold <= 0 else alpha.point(lambda v: 255 if v > transparent_threshold else 0)
+    bbox = visible.getbbox()
+    if bbox is None:
+        return result
+    left, upper = bbox[0], bbox[1]
+    alpha_arr = np.asarray(alpha.crop(bbox))
+    buffers = _band_buffers()
+
+    for kind, x0, y0, x1, y1 in mask_bands(alpha_arr, transparent_threshold, opaque_threshold):
+        box = (left + x0, upper + y0, left + x1, upper + y1)
+        if kind == "opaque":
+            result.paste(fg.crop(box), box)
+            continue
+        n, m = y1 - y0, x1 - x0
+        fg_band = np.asarray(fg.crop(box)).reshape(n, m * 3)
+        bg_band = np.asarray(result.crop(box)).reshape(n, m * 3)
+        out_band = np.empty((n, m * 3), dtype=np.uint8)
+        a = _snap(alpha_arr[y0:y1, x0:x1], transparent_threshold, opaque_threshold)
+        _blend_band(out_band, fg_band, a, bg_band, *buffers)
+        result.paste(Image.frombuffer('RGB', (m, n), out_band, 'raw', 'RGB', 0, 1), box)
+    return result
+
+def composite_over(
+    fg: Image.Image,
+    alpha: Image.Image,
+    background: Background,
+    band_limited: bool = BAND_LIMITED
+) -> Image.Image:
+    """
+    Composite an image over a background using an alpha mask in a single pass
+
+    Args:
+        fg (PIL.Image): Foreground (the original photo)
+        alpha (PIL.Image): "L" mask the same size as fg
+        background: Background image of the same size, or an RGB color
+        band_limited (bool): Blend only the mask's edge bands and copy the rest; otherwise blend the full frame
+
+    Returns:
+        PIL.Image: RGB result
+    """
+    if fg.mode != 'RGB':
+        fg = fg.convert('RGB')
+    if alpha.mode != 'L':
+        alpha = alpha.convert('L')
+    if isinstance(background, Image.Image):
+        if background.size != fg.size:
+            raise ValueError(f"Background size {background.size} does not match image size {fg.size}")
+        if background.mode != 'RGB':
+            background = background.convert('RGB')
+
+    if band_limited:
+        return _composite_bands(fg, alpha, background, TRANSPARENT_THRESHOLD, OPAQUE_THRESHOLD)
+
+    fg_arr = np.asarray(fg)
+    out = np.empty(fg_arr.shape, dtype=np.uint8)
+    if isinstance(background, Image.Image):
+        blend_into(out, fg_arr, np.asarray(alpha), np.asarray(background))
+    else:
+        blend_into(out, fg_arr, np.asarray(alpha), tuple(int(v) for v in background[:3]))  # type: ignore
+    # Wrap the buffer without another full-frame copy
+    return Image.frombuffer('RGB', fg.size, out, 'raw', 'RGB', 0, 1)
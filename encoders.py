@@ -0,0 +1,100 @@
+from PIL import Image
+import io
+from typing import Any, Dict, List, Tuple
+from settings import get_setting
+
+# Output formats offered for each kind of result; cutouts need an alpha-capable format
+COMPOSITE_FORMATS = ["JPEG", "WebP", "PNG"]
+CUTOUT_FORMATS = ["PNG", "WebP"]
+
+# File extension and MIME type per format
+FORMAT_INFO = {
+    "JPEG": ("jpg", "image/jpeg"),
+    "WebP": ("webp", "image/webp"),
+    "PNG": ("png", "image/png")
+}
+
+# Pillow's JPEG subsampling values
+JPEG_SUBSAMPLING = {
+    "4:4:4": 0,
+    "4:2:2": 1,
+    "4:2:0": 2
+}
+
+# Encoder defaults, overridable in the [output] section of the config file
+OUTPUT_DEFAULTS: Dict[str, Any] = {
+    "composite_format": "JPEG",
+    "cutout_format": "PNG",
+    "jpeg_quality": 95,
+    "jpeg_subsampling": "4:2:0",
+    "jpeg_progressive": False,
+    "jpeg_optimize": False,
+    "webp_quality": 90,
+    "webp_lossless": False,
+    "webp_method": 4,
+    "png_compress_level": 6,
+    "png_optimize": False
+}
+
+def output_settings() -> Dict[str, Any]:
+    """Effective encoder defaults after applying the config file and environment"""
+    return {key: get_setting("output", key, default) for key, default in OUTPUT_DEFAULTS.items()}
+
+def get_composite_formats() -> List[str]:
+    """Get list of formats for results with a background"""
+    return list(COMPOSITE_FORMATS)
+
+def get_cutout_formats() -> List[str]:
+    """Get list of formats for transparent cutouts"""
+    return list(CUTOUT_FORMATS)
+
+def output_format(settings: Dict[str, Any], transparent: bool) -> str:
+    """Format a result is encoded in; transparent cutouts never use JPEG"""
+    image_format = settings["cutout_format"] if transparent else settings["composite_format"]
+    if transparent and image_format not in CUTOUT_FORMATS:
+        image_format = CUTOUT_FORMATS[0]
+    return image_format
+
+def mime_type(filename: str) -> str:
+    """MIME type for an output file name"""
+    extension = filename.rsplit(".", 1)[-1].lower()
+    for ext, mime in FORMAT_INFO.values():
+        if ext == extension:
+            return mime
+    return "application/octet-stream"
+
+def encode_image(img: Image.Image, settings: Dict[str, Any]) -> Tuple[bytes, str]:
+    """
+    Encode a result with the configured encoder
+
+    Args:
+        img (PIL.Image): RGB composite or RGBA cutout
+        settings (dict): Encoder settings as returned by output_settings()
+
+    Returns:
+        tuple: (encoded bytes, file extension)
+    """
+    image_format = output_format(settings, img.mode == "RGBA")
+    stream = io.BytesIO()
+    if image_format == "JPEG":
+        img.convert("RGB").save(
+            stream, format="JPEG",
+            quality=int(settings["jpeg_quality"]),
+            subsampling=JPEG_SUBSAMPLING.get(settings["jpeg_subsampling"], 2),
+            progressive=bool(settings["jpeg_progressive"]),
+            optimize=bool(settings["jpeg_optimize"])
+        )
+    elif image_format == "WebP":
+        img.save(
+            stream, format="WEBP",
+            quality=int(settings["webp_quality"]),
+            lossless=bool(settings["webp_lossless"]),
+            method=int(settings["webp_method"])
+        )
+    else:
+        img.save(
+            stream, format="PNG",
+            compress_level=int(settings["png_compress_level"]),
+            optimize=bool(settings["png_optimize"])
+        )
+    return stream.getvalue(), FORMAT_INFO[image_format][0]
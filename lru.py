@@ -0,0 +1,42 @@
+from PIL import Image
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+def image_nbytes(img: Image.Image) -> int:
+    """Approximate in-memory size of a decoded image"""
+    return img.width * img.height * len(img.getbands())
+
+class BoundedLRU:
+    """Thread-safe least recently used map bounded by entry count and total size"""
+
+    def __init__(self, max_entries: int, max_bytes: int, sizeof: Callable[[Any], int]):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._items: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Look up a value and mark it as recently used"""
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Insert a value, evicting least recently used entries over the limits; oversized values are not kept"""
+        nbytes = self._sizeof(value)
+        if nbytes > self.max_bytes or self.max_entries <= 0:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= self._sizeof(old)
+            self._items[key] = value
+            self._bytes += nbytes
+            while self._items and (len(self._items) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= self._sizeof(evicted)
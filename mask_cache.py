@@ -0,0 +1,42 @@
+from PIL import Image
+import hashlib
+from typing import Optional, Tuple
+from settings import get_setting
+from lru import BoundedLRU, image_nbytes
+from mask_store import load_mask, save_mask, touch_mask
+
+# Process-wide mask cache limits; masks are single-channel so each costs width * height bytes
+MASK_CACHE_MAX_ENTRIES = get_setting("mask_cache", "max_entries", 1024)
+MASK_CACHE_MAX_BYTES = get_setting("mask_cache", "max_bytes", 512 * 1024 * 1024)
+
+_mask_cache = BoundedLRU(MASK_CACHE_MAX_ENTRIES, MASK_CACHE_MAX_BYTES, image_nbytes)
+
+def content_hash(data: bytes) -> str:
+    """Stable content hash of an upload"""
+    return hashlib.sha256(data).hexdigest()
+
+def mask_key(image_hash: str, model_name: str, quantized: bool, size: Tuple[int, int], inference: tuple = ()) -> Tuple[str, str, bool, Tuple[int, int], tuple]:
+    """Cache key for a mask at a given working image size; the background never takes part in it"""
+    return image_hash, model_name, quantized, tuple(size), inference
+
+def get_cached_mask(key: tuple) -> Optional[Image.Image]:
+    """Look up a mask in memory, then in the disk store, and mark it as recently used"""
+    mask = _mask_cache.get(key)
+    if mask is not None:
+        # Keep the stored copy from being evicted as stale while this process keeps using it
+        touch_mask(key)
+        return mask
+    mask = load_mask(key)
+    if mask is not None:
+        _mask_cache.put(key, mask)
+    return mask
+
+def put_cached_mask(key: tuple, mask: Image.Image) -> None:
+    """Store a new mask in memory and persist it to the disk store"""
+    if mask.mode != 'L':
+        mask = mask.convert('L')
+    _mask_cache.put(key, mask)
+    try:
+        save_mask(key, mask)
+    except OSError:
+        pass  # the disk store is best-effort; the in-memory copy still serves this process
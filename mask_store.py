@@ -0,0 +1,116 @@
+from PIL import Image
+import hashlib
+import numpy as np
+import os
+import tempfile
+import threading
+from typing import List, Optional, Tuple
+from settings import get_setting
+
+# On-disk mask store shared across restarts (and replicas on a shared volume); empty directory disables it
+MASK_STORE_DIR = os.path.expanduser(get_setting("mask_store", "directory", os.path.join("~", ".cache", "bg_pro", "masks")))
+MASK_STORE_MAX_BYTES = get_setting("mask_store", "max_bytes", 1024 * 1024 * 1024)
+# Eviction frees space down to this fraction of the limit, so a full store is not rescanned on every write
+MASK_STORE_LOW_WATER = 0.9
+
+# The running total only sees this process's writes; other processes sharing the directory are picked up by
+# measuring the store from disk again after every low-water headroom's worth of local writes
+_store_bytes: Optional[int] = None  # lazily measured on first write
+_unmeasured_bytes = 0  # written by this process since the store was last measured
+_store_lock = threading.Lock()
+
+def mask_store_enabled() -> bool:
+    """Whether the disk store is configured"""
+    return bool(MASK_STORE_DIR) and MASK_STORE_MAX_BYTES > 0
+
+def _mask_path(key: tuple) -> str:
+    """File holding the mask for a cache key, sharded by hash prefix"""
+    digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+    return os.path.join(MASK_STORE_DIR, digest[:2], f"{digest}.npy")
+
+def _scan_store() -> List[Tuple[float, int, str]]:
+    """List (mtime, size, path) for every stored mask"""
+    entries = []
+    for root, _, files in os.walk(MASK_STORE_DIR):
+        for name in files:
+            if name.endswith(".npy"):
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue  # evicted concurrently by another process
+                entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+def _evict_locked() -> None:
+    """Delete least recently used masks until the store is back under its low-water mark"""
+    global _store_bytes, _unmeasured_bytes
+    entries = sorted(_scan_store())
+    total = sum(size for _, size, _ in entries)
+    target = int(MASK_STORE_MAX_BYTES * MASK_STORE_LOW_WATER)
+    for _, size, path in entries:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+    _store_bytes = total
+    _unmeasured_bytes = 0
+
+def load_mask(key: tuple) -> Optional[Image.Image]:
+    """Read a stored mask via a memory map, or None when it is not on disk"""
+    if not mask_store_enabled():
+        return None
+    path = _mask_path(key)
+    try:
+        arr = np.load(path, mmap_mode="r")
+        os.utime(path)  # mtime doubles as the LRU timestamp
+    except (FileNotFoundError, ValueError, OSError):
+        return None
+    return Image.fromarray(arr)
+
+def touch_mask(key: tuple) -> None:
+    """Mark a stored mask as recently used, e.g. when it was served from memory"""
+    if not mask_store_enabled():
+        return
+    try:
+        os.utime(_mask_path(key))
+    except OSError:
+        pass  # not on disk (yet), or evicted by another process
+
+def save_mask(key: tuple, mask: Image.Image) -> None:
+    """Write a mask as a compact uint8 array, evicting old masks over the size limit"""
+    global _store_bytes, _unmeasured_bytes
+    if not mask_store_enabled():
+        return
+    path = _mask_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    arr = np.asarray(mask.convert("L") if mask.mode != "L" else mask, dtype=np.uint8)
+    try:
+        replaced_bytes = os.path.getsize(path)  # an existing mask for the key is overwritten, not added
+    except OSError:
+        replaced_bytes = 0
+
+    # Write to a temp file and rename so readers never see a partial mask
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, arr)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    with _store_lock:
+        written = os.path.getsize(path) - replaced_bytes
+        _unmeasured_bytes += max(0, written)
+        if _store_bytes is None or _unmeasured_bytes > MASK_STORE_MAX_BYTES * (1 - MASK_STORE_LOW_WATER):
+            _store_bytes = sum(size for _, size, _ in _scan_store())
+            _unmeasured_bytes = 0
+        else:
+            _store_bytes += written
+        if _store_bytes > MASK_STORE_MAX_BYTES:
+            _evict_locked()
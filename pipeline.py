@@ -0,0 +1,95 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+from settings import get_setting
+
+# Worker threads for decode/composite/encode; PIL, NumPy and onnxruntime release the GIL
+DEFAULT_WORKERS = get_setting("pipeline", "workers", min(4, os.cpu_count() or 1))
+
+# Segmentation chunks allowed in flight at once; onnxruntime already parallelizes each run
+DEFAULT_INFERENCE_CONCURRENCY = get_setting("pipeline", "inference_concurrency", 1)
+
+def run_pipeline(
+    items: Sequence[Any],
+    segment: Callable[[List[Any]], List[Any]],
+    finish: Callable[[Any, Any], Any],
+    batch_size: int = 1,
+    workers: int = DEFAULT_WORKERS,
+    inference_concurrency: int = DEFAULT_INFERENCE_CONCURRENCY,
+    initializer: Optional[Callable[[], None]] = None,
+    prepare: Optional[Callable[[Any], Any]] = None
+) -> Iterator[Tuple[int, Any, Optional[Exception]]]:
+    """
+    Run segmentation and per-image finishing concurrently, yielding results as they complete
+
+    Items are segmented in chunks of batch_size; as soon as a chunk's masks are
+    ready, each item is finished (composited and encoded) on the worker pool
+    while the next chunk is being segmented. With prepare, every item is first
+    mapped (e.g. decoded) on the pool, a bounded number of chunks ahead of
+    segmentation, and the prepared value is what segment and finish receive.
+
+    Args:
+        items (sequence): Work items, e.g. uploads
+        segment (callable): Maps a chunk of (prepared) items to one mask per item
+        finish (callable): Maps ((prepared) item, mask) to the final result
+        batch_size (int): Items per segmentation call
+        workers (int): Size of the thread pool
+        inference_concurrency (int): Segmentation chunks allowed to run at once
+        initializer (callable): Run in each worker thread on start
+        prepare (callable): Optional per-item first stage
+
+    Yields:
+        tuple: (item index, result or None, exception or None) in completion order
+    """
+    batch_size = max(1, batch_size)
+    inference_concurrency = max(1, inference_concurrency)
+    chunks = [list(range(i, min(i + batch_size, len(items)))) for i in range(0, len(items), batch_size)]
+    prepared: Dict[int, Any] = {} if prepare else dict(enumerate(items))
+    failed: Set[int] = set()
+    next_prepare = 0 if prepare else len(chunks)
+    next_chunk = 0
+    pending: Dict[Future, Tuple[str, Any]] = {}
+    running_segments = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), initializer=initializer) as pool:
+        while True:
+            # Prepare items at most one chunk beyond those that may be segmenting, bounding memory
+            while next_prepare < len(chunks) and next_prepare <= next_chunk + inference_concurrency:
+                for index in chunks[next_prepare]:
+                    pending[pool.submit(prepare, items[index])] = ("prepare", index)  # type: ignore
+                next_prepare += 1
+
+            # Keep a bounded number of segmentation chunks in flight so finishing work is not starved
+            while next_chunk < len(chunks) and running_segments < inference_concurrency:
+                chunk = chunks[next_chunk]
+                if any(index not in prepared and index not in failed for index in chunk):
+                    break
+                next_chunk += 1
+                ready = [index for index in chunk if index in prepared]
+                if ready:
+                    running_segments += 1
+                    pending[pool.submit(segment, [prepared[i] for i in ready])] = ("segment", ready)
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, payload = pending.pop(future)
+                error = future.exception()
+                if kind == "prepare":
+                    if error is not None:
+                        failed.add(payload)
+                        yield payload, None, error  # type: ignore
+                    else:
+                        prepared[payload] = future.result()
+                elif kind == "segment":
+                    running_segments -= 1
+                    if error is not None:
+                        for index in payload:
+                            prepared.pop(index, None)
+                            yield index, None, error  # type: ignore
+                        continue
+                    for index, mask in zip(payload, future.result()):
+                        pending[pool.submit(finish, prepared.pop(index), mask)] = ("finish", index)
+                else:
+                    yield payload, None if error is not None else future.result(), error  # type: ignore
@@ -0,0 +1,212 @@
+from PIL import Image
+import numpy as np
+from typing import Iterator, Tuple
+from scipy.ndimage import binary_erosion
+from settings import get_setting
+
+try:
+    from pymatting import cf_laplacian, cg, jacobi
+except ImportError:
+    cf_laplacian = None
+
+# Guided filter window radius (in working-resolution pixels) and regularization; smaller eps follows edges more tightly
+GUIDED_RADIUS = get_setting("inference", "guided_radius", 4)
+GUIDED_EPS = get_setting("inference", "guided_eps", 1e-3)
+
+# Working-resolution blocks whose filter slope stays below EDGE_SLOPE are flat and skip the full-resolution pass
+EDGE_BLOCK = 16
+EDGE_SLOPE = 1e-3
+
+# Trimap-band matting: thresholds and erosion as in rembg's alpha matting, solved tile by tile
+MATTING_ENABLED = get_setting("matting", "enabled", False)
+MATTING_FOREGROUND_THRESHOLD = get_setting("matting", "foreground_threshold", 240)
+MATTING_BACKGROUND_THRESHOLD = get_setting("matting", "background_threshold", 10)
+MATTING_ERODE_SIZE = get_setting("matting", "erode_size", 10)
+MATTING_TILE = get_setting("matting", "tile", 256)
+MATTING_PAD = get_setting("matting", "pad", 16)
+
+# Solver tolerance; 8-bit alpha does not need pymatting's default 1e-7
+MATTING_RTOL = 1e-4
+
+def _box_1d(x: np.ndarray, r: int, axis: int) -> np.ndarray:
+    """Windowed sum of radius r along one axis, clipped at the borders"""
+    n = x.shape[axis]
+    pad = [(0, 0)] * x.ndim
+    pad[axis] = (1, 0)
+    # Prefix sums with a leading zero, edge-padded by r so both window ends can be plain slices
+    c = np.pad(np.cumsum(x, axis=axis, dtype=np.float64), pad)
+    pad[axis] = (r, r)
+    c = np.pad(c, pad, mode='edge')
+    upper = [slice(None)] * x.ndim
+    lower = [slice(None)] * x.ndim
+    upper[axis] = slice(2 * r + 1, 2 * r + 1 + n)
+    lower[axis] = slice(0, n)
+    return c[tuple(upper)] - c[tuple(lower)]
+
+def box_filter(x: np.ndarray, r: int) -> np.ndarray:
+    """Mean over a (2r+1) x (2r+1) window, shrinking the window at the borders"""
+    h, w = x.shape
+    count_y = np.minimum(np.arange(h) + r + 1, h) - np.maximum(np.arange(h) - r, 0)
+    count_x = np.minimum(np.arange(w) + r + 1, w) - np.maximum(np.arange(w) - r, 0)
+    total = _box_1d(_box_1d(x, r, 0), r, 1)
+    return (total / np.outer(count_y, count_x)).astype(np.float32)
+
+def _edge_runs(edge: np.ndarray) -> Iterator[Tuple[int, int, int, int]]:
+    """Yield (x0, y0, x1, y1) boxes covering runs of EDGE_BLOCK blocks that contain an edge pixel"""
+    h, w = edge.shape
+    rows, cols = -(-h // EDGE_BLOCK), -(-w // EDGE_BLOCK)
+    padded = np.zeros((rows * EDGE_BLOCK, cols * EDGE_BLOCK), dtype=bool)
+    padded[:h, :w] = edge
+    blocks = padded.reshape(rows, EDGE_BLOCK, cols, EDGE_BLOCK).any(axis=(1, 3))
+    for by in range(rows):
+        # Starts and ends of consecutive edge blocks in this row
+        flags = np.concatenate(([False], blocks[by], [False])).astype(np.int8)
+        changes = np.flatnonzero(np.diff(flags))
+        for start, end in zip(changes[::2], changes[1::2]):
+            yield (int(start) * EDGE_BLOCK, by * EDGE_BLOCK,
+                   min(int(end) * EDGE_BLOCK, w), min((by + 1) * EDGE_BLOCK, h))
+
+def guided_upsample(mask: Image.Image, guide: Image.Image, full_guide: Image.Image, radius: int = GUIDED_RADIUS, eps: float = GUIDED_EPS) -> Image.Image:
+    """
+    Upsample a coarse mask to full resolution with an edge-aware guided filter
+
+    The filter's linear coefficients are solved at the working resolution
+    (mask and guide share its size), bilinearly upsampled and applied to the
+    full-resolution guide (the fast guided filter), so mask edges snap to
+    the detail of the original photo. Only blocks where the coefficients
+    actually depend on the guide are evaluated at full resolution; the rest
+    is a plain resize of the filter's offset term.
+
+    Args:
+        mask (PIL.Image): "L" mask at the working resolution
+        guide (PIL.Image): Image the mask was predicted from
+        full_guide (PIL.Image): Full-resolution image the mask should align to
+        radius (int): Filter window radius at the working resolution
+        eps (float): Regularization; larger values smooth more
+
+    Returns:
+        PIL.Image: "L" mask the size of full_guide
+    """
+    I = np.asarray(guide.convert('L'), dtype=np.float32) / 255.0
+    p = np.asarray(mask.convert('L'), dtype=np.float32) / 255.0
+
+    mean_I = box_filter(I, radius)
+    mean_p = box_filter(p, radius)
+    var_I = box_filter(I * I, radius) - mean_I * mean_I
+    cov_Ip = box_filter(I * p, radius) - mean_I * mean_p
+    a = cov_Ip / (var_I + eps)
+    b = mean_p - a * mean_I
+    mean_a = box_filter(a, radius)
+    mean_b = box_filter(b, radius) * 255.0
+    del I, p, mean_I, mean_p, var_I, cov_Ip, a, b
+
+    # Where the slope is ~0 the result is just the offset term, so a fast 8-bit resize covers it
+    size = full_guide.size
+    result = Image.fromarray(np.rint(np.clip(mean_b, 0, 255)).astype(np.uint8)).resize(size, Image.Resampling.BILINEAR)
+    scale_x, scale_y = size[0] / mask.width, size[1] / mask.height
+    gray = full_guide.convert('L')
+    slope_img, offset_img = Image.fromarray(mean_a), Image.fromarray(mean_b)
+
+    for x0, y0, x1, y1 in _edge_runs(np.abs(mean_a) > EDGE_SLOPE):
+        box = (int(x0 * scale_x), int(y0 * scale_y), min(size[0], int(np.ceil(x1 * scale_x))), min(size[1], int(np.ceil(y1 * scale_y))))
+        region = (box[2] - box[0], box[3] - box[1])
+        if region[0] <= 0 or region[1] <= 0:
+            continue
+        # Resample the coefficients for just this region, aligned with a full-frame resize
+        source = (box[0] / scale_x, box[1] / scale_y, box[2] / scale_x, box[3] / scale_y)
+        q = np.asarray(gray.crop(box), dtype=np.float32)
+        q *= np.asarray(slope_img.resize(region, Image.Resampling.BILINEAR, box=source))
+        q += np.asarray(offset_img.resize(region, Image.Resampling.BILINEAR, box=source))
+        np.clip(q, 0, 255, out=q)
+        result.paste(Image.fromarray(np.rint(q).astype(np.uint8)), box)
+    return result
+
+def matting_available() -> bool:
+    """Whether the matting solver can be imported"""
+    return cf_laplacian is not None
+
+def trimap_from_mask(mask: np.ndarray, foreground_threshold: int = MATTING_FOREGROUND_THRESHOLD, background_threshold: int = MATTING_BACKGROUND_THRESHOLD, erode_size: int = MATTING_ERODE_SIZE) -> np.ndarray:
+    """Trimap (0 background, 128 unknown, 255 foreground) from a mask, eroding both known regions like rembg"""
+    is_foreground = mask > foreground_threshold
+    is_background = mask < background_threshold
+    if erode_size > 0:
+        # A square structuring element is separable into a row and a column pass
+        for structure in (np.ones((1, erode_size), dtype=bool), np.ones((erode_size, 1), dtype=bool)):
+            is_foreground = binary_erosion(is_foreground, structure=structure)
+            is_background = binary_erosion(is_background, structure=structure, border_value=1)
+    trimap = np.full(mask.shape, 128, dtype=np.uint8)
+    trimap[is_foreground] = 255
+    trimap[is_background] = 0
+    return trimap
+
+def _unknown_tiles(unknown: np.ndarray, tile: int) -> Iterator[Tuple[int, int, int, int]]:
+    """Yield (x0, y0, x1, y1) for every tile of the grid that holds unknown pixels"""
+    h, w = unknown.shape
+    rows, cols = -(-h // tile), -(-w // tile)
+    padded = np.zeros((rows * tile, cols * tile), dtype=bool)
+    padded[:h, :w] = unknown
+    hits = padded.reshape(rows, tile, cols, tile).any(axis=(1, 3))
+    for ty, tx in zip(*np.nonzero(hits)):
+        yield int(tx) * tile, int(ty) * tile, min((int(tx) + 1) * tile, w), min((int(ty) + 1) * tile, h)
+
+def _solve_tile(image: np.ndarray, trimap: np.ndarray, initial: np.ndarray) -> np.ndarray:
+    """
+    Closed-form matting of one crop, as pymatting's estimate_alpha_cf but warm-started
+
+    The unknown pixels start from the mask's alpha and the conjugate gradient
+    solve uses a Jacobi preconditioner with an 8-bit-sufficient tolerance,
+    which is far cheaper than a cold ichol-preconditioned solve on small crops.
+    """
+    is_unknown = (trimap == 128).ravel()
+    is_known = ~is_unknown
+    L = cf_laplacian(image / 255.0, is_known=is_known.reshape(trimap.shape))
+    L_U = L[is_unknown, :][:, is_unknown]
+    R = L[is_unknown, :][:, is_known]
+    rhs = -R.dot((trimap.ravel()[is_known] == 255).astype(np.float64))
+    x0 = initial.ravel()[is_unknown] / 255.0
+    alpha = cg(L_U, rhs, x0=x0, rtol=MATTING_RTOL, M=jacobi(L_U))
+    return np.clip(np.rint(alpha * 255), 0, 255).astype(np.uint8)
+
+def matte_edges(img: Image.Image, mask: Image.Image, tile: int = MATTING_TILE, pad: int = MATTING_PAD) -> Image.Image:
+    """
+    Refine a mask with closed-form alpha matting restricted to the trimap's unknown band
+
+    Only grid tiles that contain unknown pixels are solved, each on a crop
+    padded by pad pixels so the solver sees known pixels around the band;
+    definite foreground and background keep the mask's values.
+
+    Args:
+        img (PIL.Image): Image the mask belongs to
+        mask (PIL.Image): "L" mask the same size as img
+        tile (int): Grid tile size in pixels
+        pad (int): Context added around each tile
+
+    Returns:
+        PIL.Image: Refined "L" mask
+    """
+    if not matting_available():
+        raise RuntimeError("Edge matting requires pymatting (installed with rembg)")
+    # Tiles that cannot be solved keep the mask's values
+    alpha = np.array(mask.convert('L'))
+    trimap = trimap_from_mask(alpha)
+    unknown = trimap == 128
+    if not unknown.any():
+        return mask
+    image = np.asarray(img.convert('RGB'))
+    h, w = alpha.shape
+
+    for x0, y0, x1, y1 in _unknown_tiles(unknown, tile):
+        cx0, cy0, cx1, cy1 = max(0, x0 - pad), max(0, y0 - pad), min(w, x1 + pad), min(h, y1 + pad)
+        crop_unknown = unknown[cy0:cy1, cx0:cx1]
+        crop_trimap = np.where(crop_unknown, 128, trimap[cy0:cy1, cx0:cx1])
+        # The solver needs both definite foreground and background in view
+        if not (crop_trimap == 255).any() or not (crop_trimap == 0).any():
+            continue
+        crop_alpha = alpha[cy0:cy1, cx0:cx1]
+        solved = crop_alpha.copy()
+        solved[crop_unknown] = _solve_tile(image[cy0:cy1, cx0:cx1], crop_trimap, crop_alpha)
+        # Only the tile's own pixels are kept; the padding is context for the solver
+        core = (slice(y0 - cy0, y1 - cy0), slice(x0 - cx0, x1 - cx0))
+        region = unknown[y0:y1, x0:x1]
+        alpha[y0:y1, x0:x1][region] = solved[core][region]
+    return Image.fromarray(alpha)
@@ -0,0 +1,26 @@
+from typing import Optional, Tuple
+from settings import get_setting
+from lru import BoundedLRU
+from mask_cache import content_hash
+
+# Finished results kept per process; entries hold only encoded bytes, so each costs roughly one output file
+RESULT_CACHE_MAX_ENTRIES = get_setting("result_cache", "max_entries", 256)
+RESULT_CACHE_MAX_BYTES = get_setting("result_cache", "max_bytes", 512 * 1024 * 1024)
+
+def _result_nbytes(result: tuple) -> int:
+    """Encoded size of a result: every bytes field it carries"""
+    return sum(len(field) for field in result if isinstance(field, bytes))
+
+_result_cache = BoundedLRU(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_BYTES, _result_nbytes)
+
+def result_id(image_hash: str, params: tuple) -> str:
+    """Content-addressed id of a result: the same input and settings always give the same id"""
+    return content_hash(repr((image_hash,) + params).encode("utf-8"))[:16]
+
+def get_cached_result(output_id: str) -> Optional[Tuple]:
+    """Look up a finished result and mark it as recently used"""
+    return _result_cache.get(output_id)
+
+def put_cached_result(output_id: str, result: Tuple) -> None:
+    """Keep a finished result, evicting least recently used ones over the limits"""
+    _result_cache.put(output_id, result)
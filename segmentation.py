@@ -0,0 +1,330 @@
+from PIL import Image
+import numpy as np
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+import onnxruntime as ort
+from rembg.bg import fix_image_orientation, naive_cutout
+from rembg.sessions import sessions_class
+from rembg.sessions.base import BaseSession
+from settings import get_setting
+from refinement import (
+    EDGE_BLOCK, EDGE_SLOPE, GUIDED_EPS, GUIDED_RADIUS, MATTING_BACKGROUND_THRESHOLD, MATTING_ERODE_SIZE,
+    MATTING_FOREGROUND_THRESHOLD, MATTING_PAD, MATTING_RTOL, MATTING_TILE, guided_upsample
+)
+
+# Model used when none is selected
+DEFAULT_MODEL = "u2net"
+
+# Available segmentation models: display name -> rembg model name
+MODEL_MAP = {
+    "U2Net (general)": "u2net",
+    "U2NetP (fast)": "u2netp",
+    "Silueta (small)": "silueta",
+    "ISNet (high quality)": "isnet-general-use",
+    "U2Net Human (people)": "u2net_human_seg"
+}
+
+# Speed/quality presets ("refine" adds a second pass on the subject crop); "Custom" lets the user pick the model directly
+QUALITY_PRESETS: Dict[str, Optional[Dict[str, Any]]] = {
+    "Fast": {"model": "u2netp", "quantized": True, "refine": False},
+    "Balanced": {"model": "u2net", "quantized": False, "refine": False},
+    "Portrait": {"model": "u2net_human_seg", "quantized": False, "refine": True},
+    "Quality": {"model": "isnet-general-use", "quantized": False, "refine": True},
+    "Custom": None
+}
+DEFAULT_PRESET = "Balanced"
+
+# Model input normalization (mean, std, input size), mirroring each rembg session's predict()
+_U2NET_INPUT = ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320))
+MODEL_INPUTS = {
+    "u2net": _U2NET_INPUT,
+    "u2netp": _U2NET_INPUT,
+    "silueta": _U2NET_INPUT,
+    "u2net_human_seg": _U2NET_INPUT,
+    "isnet-general-use": ((0.5, 0.5, 0.5), (1.0, 1.0, 1.0), (1024, 1024))
+}
+
+# Images stacked into one onnxruntime call by the batch inference path
+DEFAULT_BATCH_SIZE = get_setting("inference", "batch_size", 8)
+
+# Longest side images are downscaled to before segmentation (0 = segment at full size);
+# the mask is then upsampled back, guided by the full-resolution photo unless disabled
+INFERENCE_WORKING_SIZE = get_setting("inference", "working_size", 1024)
+GUIDED_UPSAMPLING = get_setting("inference", "guided_upsampling", True)
+
+# Second pass: the subject's bounding box (alpha above REFINE_THRESHOLD) is grown by REFINE_MARGIN
+# of its size on each side and segmented again; skipped when the crop would cover most of the frame
+REFINE_MARGIN = get_setting("inference", "refine_margin", 0.1)
+REFINE_THRESHOLD = 32
+REFINE_MAX_COVERAGE = 0.8
+
+# Locally stored int8-quantized variants are looked up as <dir>/<model>.int8.onnx
+QUANTIZED_MODEL_DIR = os.path.expanduser(os.getenv(
+    "BGPRO_QUANTIZED_MODEL_DIR",
+    os.getenv("U2NET_HOME", os.path.join(os.getenv("XDG_DATA_HOME", "~"), ".u2net"))
+))
+
+# rembg session used to load a custom ONNX file with the same pre/post-processing
+_CUSTOM_SESSION_MAP = {
+    "isnet-general-use": "dis_custom"
+}
+
+# onnxruntime SessionOptions defaults, overridable in the [onnxruntime] section
+# of the config file or via BGPRO_ONNXRUNTIME_<KEY> environment variables
+ORT_OPTION_DEFAULTS: Dict[str, Any] = {
+    "intra_op_num_threads": 0,  # 0 lets onnxruntime pick (one per physical core)
+    "inter_op_num_threads": 0,
+    "execution_mode": "sequential",  # sequential | parallel
+    "graph_optimization_level": "all",  # disable | basic | extended | all
+    "enable_cpu_mem_arena": True,
+    "enable_mem_pattern": True
+}
+
+_EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL
+}
+
+_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+}
+
+# Process-wide rembg sessions, shared by every image and every Streamlit session
+_sessions: Dict[Tuple[str, bool], BaseSession] = {}
+_sessions_lock = threading.Lock()
+
+def quantized_model_path(model_name: str) -> str:
+    """Path where the int8-quantized variant of a model is expected"""
+    return os.path.join(QUANTIZED_MODEL_DIR, f"{model_name}.int8.onnx")
+
+def quantized_model_available(model_name: str) -> bool:
+    """Whether an int8-quantized variant of the model is stored locally"""
+    return os.path.isfile(quantized_model_path(model_name))
+
+def resolve_preset(preset: str, model_name: Optional[str] = None, quantized: bool = False) -> Tuple[str, bool]:
+    """
+    Resolve a preset to the (model name, quantized) pair to run
+
+    Args:
+        preset (str): Preset name from QUALITY_PRESETS
+        model_name (str): Model used by the "Custom" preset
+        quantized (bool): Whether the "Custom" preset prefers the int8 variant
+
+    Returns:
+        tuple: (model name, quantized); quantized is only True when the file exists
+    """
+    settings = QUALITY_PRESETS.get(preset, QUALITY_PRESETS[DEFAULT_PRESET])
+    if settings is not None:
+        model_name, quantized = settings["model"], settings["quantized"]
+    model_name = model_name or DEFAULT_MODEL
+    return model_name, bool(quantized) and quantized_model_available(model_name)
+
+def resolve_refinement(preset: str, refine: bool = False) -> bool:
+    """Whether a preset runs the second segmentation pass; "Custom" uses the given choice"""
+    settings = QUALITY_PRESETS.get(preset, QUALITY_PRESETS[DEFAULT_PRESET])
+    return bool(settings["refine"] if settings is not None else refine)
+
+def ort_settings() -> Dict[str, Any]:
+    """Effective onnxruntime settings after applying the config file and environment"""
+    settings = {key: get_setting("onnxruntime", key, default) for key, default in ORT_OPTION_DEFAULTS.items()}
+    if settings["execution_mode"] not in _EXECUTION_MODES:
+        raise ValueError(f"Unknown execution_mode: {settings['execution_mode']}")
+    if settings["graph_optimization_level"] not in _OPTIMIZATION_LEVELS:
+        raise ValueError(f"Unknown graph_optimization_level: {settings['graph_optimization_level']}")
+    return settings
+
+def build_session_options(settings: Optional[Dict[str, Any]] = None) -> ort.SessionOptions:
+    """Translate settings into onnxruntime SessionOptions"""
+    settings = settings or ort_settings()
+    sess_opts = ort.SessionOptions()
+    sess_opts.intra_op_num_threads = int(settings["intra_op_num_threads"])
+    sess_opts.inter_op_num_threads = int(settings["inter_op_num_threads"])
+    sess_opts.execution_mode = _EXECUTION_MODES[settings["execution_mode"]]
+    sess_opts.graph_optimization_level = _OPTIMIZATION_LEVELS[settings["graph_optimization_level"]]
+    sess_opts.enable_cpu_mem_arena = bool(settings["enable_cpu_mem_arena"])
+    sess_opts.enable_mem_pattern = bool(settings["enable_mem_pattern"])
+    return sess_opts
+
+def _create_session(model_name: str, quantized: bool) -> BaseSession:
+    """Build a rembg session for a stock model or its local int8 variant"""
+    kwargs: Dict[str, Any] = {}
+    session_name = model_name
+    if quantized:
+        path = quantized_model_path(model_name)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Quantized model not found: {path}")
+        session_name = _CUSTOM_SESSION_MAP.get(model_name, "u2net_custom")
+        kwargs["model_path"] = path
+    
+    # rembg's new_session builds its own SessionOptions, so construct the class directly
+    for session_class in sessions_class:
+        if session_class.name() == session_name:
+            return session_class(session_name, build_session_options(), **kwargs)
+    raise ValueError(f"No session class found for model '{session_name}'")
+
+def warm_up_session(session: BaseSession) -> None:
+    """Run one dummy inference so the first real image does not pay graph initialization"""
+    session.predict(Image.new('RGB', (64, 64), (127, 127, 127)))
+
+def get_session(model_name: str = DEFAULT_MODEL, quantized: bool = False) -> BaseSession:
+    """Return the shared session for a model, creating and warming it up on first use"""
+    key = (model_name, quantized)
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _create_session(model_name, quantized)
+                warm_up_session(session)
+                _sessions[key] = session
+    return session
+
+def _model_batch_limit(session: BaseSession) -> Optional[int]:
+    """Batch size the ONNX graph is fixed to, or None when the batch axis is dynamic"""
+    batch_dim = session.inner_session.get_inputs()[0].shape[0]
+    return batch_dim if isinstance(batch_dim, int) and batch_dim > 0 else None
+
+def _prepare_input(img: Image.Image, mean: Tuple[float, float, float], std: Tuple[float, float, float], size: Tuple[int, int]) -> np.ndarray:
+    """Normalize one image to a CHW tensor exactly like rembg's BaseSession.normalize"""
+    im_ary = np.array(img.convert("RGB").resize(size, Image.Resampling.LANCZOS))
+    im_ary = im_ary / max(np.max(im_ary), 1e-6)
+    im_ary = (im_ary - np.asarray(mean)) / np.asarray(std)
+    return im_ary.transpose((2, 0, 1)).astype(np.float32)
+
+def _pred_to_mask(pred: np.ndarray, size: Tuple[int, int]) -> Image.Image:
+    """Min-max normalize one prediction and resize it to the image size"""
+    ma, mi = np.max(pred), np.min(pred)
+    pred = (pred - mi) / (ma - mi)
+    mask = Image.fromarray((pred.clip(0, 1) * 255).astype("uint8"), mode="L")
+    return mask.resize(size, Image.Resampling.LANCZOS)
+
+def inference_signature(refine: bool = False, matting: bool = False) -> tuple:
+    """Settings that change a predicted mask besides the model, for use in cache keys"""
+    guided = (GUIDED_RADIUS, GUIDED_EPS, EDGE_BLOCK, EDGE_SLOPE) if GUIDED_UPSAMPLING else None
+    signature = INFERENCE_WORKING_SIZE, guided, (REFINE_MARGIN, REFINE_THRESHOLD, REFINE_MAX_COVERAGE) if refine else None
+    if not matting:
+        return signature
+    # Matted masks are cached beside the raw ones, so the matting settings only extend the key
+    return signature + ((
+        MATTING_FOREGROUND_THRESHOLD, MATTING_BACKGROUND_THRESHOLD, MATTING_ERODE_SIZE, MATTING_TILE, MATTING_PAD, MATTING_RTOL
+    ),)
+
+def working_image(img: Image.Image, working_size: int = INFERENCE_WORKING_SIZE) -> Image.Image:
+    """Downscale an image so its longest side fits the inference working size"""
+    longest = max(img.size)
+    if not working_size or longest <= working_size:
+        return img
+    scale = working_size / longest
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+def upsample_mask(mask: Image.Image, small: Image.Image, img: Image.Image) -> Image.Image:
+    """Bring a mask predicted on the working image back to the full image size"""
+    if small is img:
+        return mask
+    if GUIDED_UPSAMPLING:
+        return guided_upsample(mask, small, img)
+    return mask.resize(img.size, Image.Resampling.LANCZOS)
+
+def refine_crop_box(mask: Image.Image, margin: float = REFINE_MARGIN) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Crop box around the subject of a first-pass mask, or None when a second pass would not help
+
+    Args:
+        mask (PIL.Image): "L" mask from the first pass
+        margin (float): Fraction of the subject's width/height added on each side
+
+    Returns:
+        tuple: (left, upper, right, lower) in mask coordinates, or None
+    """
+    bbox = mask.point(lambda v: 255 if v > REFINE_THRESHOLD else 0).getbbox()
+    if bbox is None:
+        return None
+    left, upper, right, lower = bbox
+    pad_x, pad_y = int((right - left) * margin), int((lower - upper) * margin)
+    box = (max(0, left - pad_x), max(0, upper - pad_y), min(mask.width, right + pad_x), min(mask.height, lower + pad_y))
+    if (box[2] - box[0]) * (box[3] - box[1]) > REFINE_MAX_COVERAGE * mask.width * mask.height:
+        return None
+    return box
+
+def merge_refined_mask(mask: Image.Image, refined: Image.Image, box: Tuple[int, int, int, int]) -> Image.Image:
+    """Replace the crop region of a first-pass mask with the second-pass mask"""
+    merged = mask.copy()
+    merged.paste(refined, box[:2])
+    return merged
+
+def _predict_batched(session: BaseSession, images: List[Image.Image], model_name: str, batch_size: int) -> List[Image.Image]:
+    """Run images through the session in N-sized input tensors, masks at each image's size"""
+    mean, std, size = MODEL_INPUTS.get(model_name, _U2NET_INPUT)
+    input_name = session.inner_session.get_inputs()[0].name
+    masks: List[Image.Image] = []
+    for start in range(0, len(images), batch_size):
+        chunk = images[start:start + batch_size]
+        small = [working_image(img) for img in chunk]
+        batch = np.stack([_prepare_input(img, mean, std, size) for img in small])
+        preds = session.inner_session.run(None, {input_name: batch})[0][:, 0, :, :]
+        for pred, img, small_img in zip(preds, chunk, small):
+            masks.append(upsample_mask(_pred_to_mask(pred, small_img.size), small_img, img))
+    return masks
+
+def predict_masks(images: List[Image.Image], model_name: str = DEFAULT_MODEL, quantized: bool = False, batch_size: int = DEFAULT_BATCH_SIZE, refine: bool = False) -> List[Image.Image]:
+    """
+    Predict masks for many images, stacking them into N-sized input tensors
+
+    Images larger than INFERENCE_WORKING_SIZE are segmented at that size and
+    their masks upsampled to the full resolution afterwards. With refine, the
+    subject crops found by the first pass are segmented again (also batched)
+    and merged back, spending the model's resolution on the subject only.
+
+    Args:
+        images (list): Images to segment (orientation is fixed like rembg.remove does)
+        model_name (str): Model from MODEL_MAP
+        quantized (bool): Use the local int8 variant
+        batch_size (int): Images per onnxruntime call
+        refine (bool): Run the second pass on each subject crop
+
+    Returns:
+        list: One "L" mode mask per image, identical to the single-image path
+    """
+    session = get_session(model_name, quantized)
+    limit = _model_batch_limit(session)
+    batch_size = max(1, min(batch_size, limit) if limit else batch_size)
+    
+    images = [fix_image_orientation(img) for img in images]
+    masks = _predict_batched(session, images, model_name, batch_size)
+    if refine:
+        boxes = [refine_crop_box(mask) for mask in masks]
+        targets = [i for i, box in enumerate(boxes) if box is not None]
+        crops = [images[i].crop(boxes[i]) for i in targets]
+        for i, refined in zip(targets, _predict_batched(session, crops, model_name, batch_size)):
+            masks[i] = merge_refined_mask(masks[i], refined, boxes[i])  # type: ignore
+    return masks
+
+def predict_mask(img: Image.Image, model_name: str = DEFAULT_MODEL, quantized: bool = False, refine: bool = False) -> Image.Image:
+    """Predict the mask for a single image with the shared session"""
+    session = get_session(model_name, quantized)
+    img = fix_image_orientation(img)
+    small = working_image(img)
+    mask = upsample_mask(session.predict(small)[0], small, img)
+    box = refine_crop_box(mask) if refine else None
+    if box is not None:
+        crop = img.crop(box)
+        small = working_image(crop)
+        mask = merge_refined_mask(mask, upsample_mask(session.predict(small)[0], small, crop), box)
+    return mask
+
+def cutout_with_mask(img: Image.Image, mask: Image.Image) -> Image.Image:
+    """Build the RGBA cutout rembg.remove would return for this image and mask"""
+    return naive_cutout(fix_image_orientation(img), mask)
+
+def get_available_presets() -> list[str]:
+    """Get list of speed/quality presets"""
+    return list(QUALITY_PRESETS.keys())
+
+def get_available_models() -> list[str]:
+    """Get list of segmentation model display names"""
+    return list(MODEL_MAP.keys())
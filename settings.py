@@ -0,0 +1,58 @@
+import os
+from typing import Any, Optional
+
+try:
+    import tomllib
+
+    def _parse_toml(text: str) -> dict:
+        return tomllib.loads(text)
+except ImportError:  # Python < 3.11; toml ships with streamlit
+    import toml
+
+    def _parse_toml(text: str) -> dict:
+        return toml.loads(text)
+
+# Config file read once at startup; environment variables override its values
+CONFIG_PATH = os.getenv("BGPRO_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "bg_pro.toml"))
+
+_TRUE_VALUES = ("1", "true", "yes", "on")
+
+_config: Optional[dict] = None
+
+def load_config() -> dict:
+    """Load the config file once; a missing file means all defaults"""
+    global _config
+    if _config is None:
+        if os.path.isfile(CONFIG_PATH):
+            with open(CONFIG_PATH, encoding="utf-8") as f:
+                _config = _parse_toml(f.read())
+        else:
+            _config = {}
+    return _config
+
+def env_name(section: str, key: str) -> str:
+    """Environment variable that overrides a config value, e.g. BGPRO_ONNXRUNTIME_INTRA_OP_NUM_THREADS"""
+    return f"BGPRO_{section}_{key}".upper()
+
+def get_setting(section: str, key: str, default: Any) -> Any:
+    """
+    Read a setting from the environment, then the config file, then the default
+
+    Args:
+        section (str): Config file section, e.g. "onnxruntime"
+        key (str): Key within the section
+        default: Fallback value; its type is used to parse environment strings
+
+    Returns:
+        The effective value
+    """
+    raw = os.getenv(env_name(section, key))
+    if raw is None:
+        return load_config().get(section, {}).get(key, default)
+    if isinstance(default, bool):
+        return raw.strip().lower() in _TRUE_VALUES
+    if isinstance(default, int):
+        return int(raw)
+    if isinstance(default, float):
+        return float(raw)
+    return raw
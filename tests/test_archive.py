@@ -0,0 +1,38 @@
+import io
+import zipfile
+from archive import StreamingArchive
+
+def _members(archive_file):
+    with zipfile.ZipFile(archive_file) as archive:
+        return {info.filename: (info.compress_type, archive.read(info)) for info in archive.infolist()}
+
+def test_small_archive_stays_in_memory():
+    archive = StreamingArchive(spool_bytes=1 << 20)
+    assert archive.add("a.png", b"png bytes")
+    assert archive.add("notes.txt", b"text " * 100)
+    result = archive.finish()
+    assert isinstance(result, io.BytesIO)
+    assert result.read(2) == b"PK"
+    members = _members(result)
+    assert members["a.png"] == (zipfile.ZIP_STORED, b"png bytes")
+    assert members["notes.txt"] == (zipfile.ZIP_DEFLATED, b"text " * 100)
+    archive.close()
+
+def test_large_archive_rolls_over_to_a_temporary_file():
+    archive = StreamingArchive(spool_bytes=1000)
+    payloads = {f"{i}.jpg": bytes([i]) * 600 for i in range(5)}
+    for name, data in payloads.items():
+        assert archive.add(name, data)
+    result = archive.finish()
+    assert isinstance(result, io.FileIO)
+    assert result.read(2) == b"PK"
+    assert {name: data for name, (_, data) in _members(result).items()} == payloads
+    archive.close()
+    assert result.closed
+
+def test_duplicate_names_are_skipped():
+    archive = StreamingArchive()
+    assert archive.add("a.png", b"first")
+    assert not archive.add("a.png", b"second")
+    assert _members(archive.finish()) == {"a.png": (zipfile.ZIP_STORED, b"first")}
+    archive.close()
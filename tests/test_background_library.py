@@ -0,0 +1,63 @@
+import io
+import os
+import pytest
+from PIL import Image
+import background_library
+from background_library import fit_preset, preset_library
+from lru import BoundedLRU, image_nbytes
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    monkeypatch.setattr(background_library, "BACKGROUND_DIR", str(tmp_path))
+    monkeypatch.setattr(background_library, "VARIANT_SIZES", [64, 128])
+    monkeypatch.setattr(background_library, "_library", {})
+    monkeypatch.setattr(background_library, "_variants", BoundedLRU(4, 1 << 30, lambda variants: sum(image_nbytes(v) for v in variants.values())))
+    monkeypatch.setattr(background_library, "_fitted", BoundedLRU(16, 1 << 30, image_nbytes))
+    builds = []
+    build_variants = background_library._build_variants
+    monkeypatch.setattr(background_library, "_build_variants", lambda preset: (builds.append(preset.name), build_variants(preset))[1])
+    return tmp_path, builds
+
+def _write(path, color, mtime):
+    Image.new("RGB", (400, 200), color).save(path, format="PNG")
+    os.utime(path, (mtime, mtime))
+
+def test_library_indexes_thumbnails_without_building_variants(library):
+    folder, builds = library
+    _write(folder / "a.png", (255, 0, 0), 1_000)
+    _write(folder / "b.png", (0, 255, 0), 1_000)
+    (folder / "notes.txt").write_text("not a background")
+    presets = preset_library()
+    assert [preset.name for preset in presets] == ["a.png", "b.png"]
+    assert presets[0].size == (400, 200)
+    assert Image.open(io.BytesIO(presets[0].thumbnail)).width == background_library.THUMBNAIL_WIDTH
+    assert builds == []
+
+def test_fit_preset_builds_variants_once(library):
+    folder, builds = library
+    _write(folder / "a.png", (255, 0, 0), 1_000)
+    preset_library()
+    assert fit_preset("a.png", (100, 50)).size == (100, 50)
+    # Photos larger than every variant are upscaled from the largest
+    assert fit_preset("a.png", (300, 150)).size == (300, 150)
+    assert fit_preset("a.png", (100, 50)).getpixel((0, 0)) == (255, 0, 0)
+    assert builds == ["a.png"]
+
+def test_modified_preset_gets_new_variants(library):
+    folder, builds = library
+    _write(folder / "a.png", (255, 0, 0), 1_000)
+    preset_library()
+    assert fit_preset("a.png", (100, 50)).getpixel((0, 0)) == (255, 0, 0)
+    _write(folder / "a.png", (0, 0, 255), 2_000)
+    preset_library()
+    assert fit_preset("a.png", (100, 50)).getpixel((0, 0)) == (0, 0, 255)
+    assert builds == ["a.png", "a.png"]
+
+def test_removed_preset_is_unavailable(library):
+    folder, _ = library
+    _write(folder / "a.png", (255, 0, 0), 1_000)
+    preset_library()
+    os.remove(folder / "a.png")
+    assert preset_library() == []
+    with pytest.raises(ValueError):
+        fit_preset("a.png", (100, 50))
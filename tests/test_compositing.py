@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from PIL import Image
+from compositing import composite_over
+
+def _images(seed=0, size=(333, 257)):
+    rng = np.random.default_rng(seed)
+    w, h = size
+    fg = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    bg = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    # Opaque subject with a soft, noisy edge and transparent surroundings
+    alpha = np.zeros((h, w), dtype=np.uint8)
+    alpha[60:200, 80:250] = 255
+    alpha[55:205, 75:80] = rng.integers(0, 256, (150, 5), dtype=np.uint8)
+    alpha[200:205, 80:250] = rng.integers(0, 256, (5, 170), dtype=np.uint8)
+    return fg, alpha, bg
+
+def _reference(fg, alpha, bg):
+    a = alpha[..., None].astype(np.float64) / 255.0
+    return np.rint(fg * a + np.asarray(bg, dtype=np.float64) * (1.0 - a))
+
+@pytest.mark.parametrize("band_limited", [True, False])
+def test_matches_float_reference_over_image(band_limited):
+    fg, alpha, bg = _images()
+    result = composite_over(Image.fromarray(fg), Image.fromarray(alpha), Image.fromarray(bg), band_limited=band_limited)
+    assert result.mode == "RGB" and result.size == (fg.shape[1], fg.shape[0])
+    diff = np.abs(np.asarray(result, dtype=np.int16) - _reference(fg, alpha, bg))
+    assert diff.max() <= 1
+
+@pytest.mark.parametrize("band_limited", [True, False])
+def test_matches_float_reference_over_color(band_limited):
+    fg, alpha, _ = _images(seed=1)
+    color = (12, 200, 97)
+    result = composite_over(Image.fromarray(fg), Image.fromarray(alpha), color, band_limited=band_limited)
+    diff = np.abs(np.asarray(result, dtype=np.int16) - _reference(fg, alpha, color))
+    assert diff.max() <= 1
+
+def test_band_limited_equals_full_frame():
+    fg, alpha, bg = _images(seed=2)
+    args = Image.fromarray(fg), Image.fromarray(alpha), Image.fromarray(bg)
+    assert np.array_equal(np.asarray(composite_over(*args, band_limited=True)), np.asarray(composite_over(*args, band_limited=False)))
+
+def test_fully_transparent_mask_returns_background():
+    fg, _, bg = _images(seed=3)
+    alpha = np.zeros(fg.shape[:2], dtype=np.uint8)
+    result = composite_over(Image.fromarray(fg), Image.fromarray(alpha), Image.fromarray(bg))
+    assert np.array_equal(np.asarray(result), bg)
+
+def test_background_size_mismatch_is_rejected():
+    fg, alpha, _ = _images()
+    with pytest.raises(ValueError):
+        composite_over(Image.fromarray(fg), Image.fromarray(alpha), Image.new("RGB", (10, 10)))
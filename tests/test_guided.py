@@ -0,0 +1,42 @@
+import numpy as np
+from PIL import Image
+from refinement import GUIDED_EPS, GUIDED_RADIUS, box_filter, guided_upsample
+
+def _scene(size, seed):
+    """Textured photo with a soft-edged disc as the mask"""
+    w, h = size
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:h, 0:w]
+    disc = np.hypot(xx - w / 2, yy - h / 2) < min(w, h) / 3
+    photo = np.where(disc[..., None], 180, 60) + rng.integers(0, 30, (h, w, 3))
+    return Image.fromarray(photo.astype(np.uint8)), Image.fromarray((disc * 255).astype(np.uint8))
+
+def test_box_filter_matches_a_clipped_window_mean():
+    x = np.random.default_rng(0).random((7, 9)).astype(np.float32)
+    r = 2
+    expected = np.array([[x[max(0, i - r):i + r + 1, max(0, j - r):j + r + 1].mean() for j in range(9)] for i in range(7)])
+    assert np.allclose(box_filter(x, r), expected, atol=1e-5)
+
+def test_matches_the_full_frame_fast_guided_filter():
+    full, _ = _scene((480, 360), 1)
+    guide = full.resize((160, 120), Image.Resampling.BILINEAR)
+    _, mask = _scene((160, 120), 2)
+    result = guided_upsample(mask, guide, full)
+    assert result.mode == "L" and result.size == full.size
+
+    # Reference: evaluate a * I + b over the whole frame instead of only the edge blocks
+    I = np.asarray(guide.convert("L"), dtype=np.float32) / 255.0
+    p = np.asarray(mask, dtype=np.float32) / 255.0
+    mean_I, mean_p = box_filter(I, GUIDED_RADIUS), box_filter(p, GUIDED_RADIUS)
+    a = (box_filter(I * p, GUIDED_RADIUS) - mean_I * mean_p) / (box_filter(I * I, GUIDED_RADIUS) - mean_I * mean_I + GUIDED_EPS)
+    b = mean_p - a * mean_I
+    slope = Image.fromarray(box_filter(a, GUIDED_RADIUS)).resize(full.size, Image.Resampling.BILINEAR)
+    offset = Image.fromarray(box_filter(b, GUIDED_RADIUS) * 255).resize(full.size, Image.Resampling.BILINEAR)
+    expected = np.rint(np.clip(np.asarray(full.convert("L"), dtype=np.float32) * np.asarray(slope) + np.asarray(offset), 0, 255))
+    assert np.abs(np.asarray(result, dtype=np.float32) - expected).max() <= 1
+
+def test_flat_mask_stays_flat():
+    full, _ = _scene((300, 200), 3)
+    guide = full.resize((150, 100), Image.Resampling.BILINEAR)
+    result = guided_upsample(Image.new("L", guide.size, 255), guide, full)
+    assert (np.asarray(result) == 255).all()
@@ -0,0 +1,36 @@
+from PIL import Image
+from lru import BoundedLRU, image_nbytes
+
+def test_evicts_least_recently_used_by_entries():
+    cache = BoundedLRU(2, 1 << 20, len)
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    assert cache.get("a") == b"1"  # "b" is now the oldest
+    cache.put("c", b"3")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1" and cache.get("c") == b"3"
+
+def test_evicts_by_bytes_and_skips_oversized_values():
+    cache = BoundedLRU(10, 10, len)
+    cache.put("a", b"x" * 4)
+    cache.put("b", b"x" * 4)
+    cache.put("c", b"x" * 4)
+    assert cache.get("a") is None and cache.get("b") is not None
+    cache.put("huge", b"x" * 11)
+    assert cache.get("huge") is None and cache.get("c") is not None
+
+def test_replacing_a_key_frees_its_old_size():
+    cache = BoundedLRU(10, 10, len)
+    for _ in range(5):
+        cache.put("a", b"x" * 6)
+    cache.put("b", b"x" * 4)
+    assert cache.get("a") is not None and cache.get("b") is not None
+
+def test_disabled_cache_keeps_nothing():
+    cache = BoundedLRU(0, 1 << 20, len)
+    cache.put("a", b"1")
+    assert cache.get("a") is None
+
+def test_image_nbytes_counts_bands():
+    assert image_nbytes(Image.new("L", (10, 20))) == 200
+    assert image_nbytes(Image.new("RGBA", (10, 20))) == 800
@@ -0,0 +1,71 @@
+import os
+import numpy as np
+import pytest
+from PIL import Image
+import mask_cache
+import mask_store
+from lru import BoundedLRU, image_nbytes
+from mask_store import _mask_path, load_mask, save_mask
+
+MASK_FILE_BYTES = 228  # .npy header plus a 10x10 uint8 mask
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(mask_store, "MASK_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(mask_store, "MASK_STORE_MAX_BYTES", 10 * MASK_FILE_BYTES)
+    monkeypatch.setattr(mask_store, "_store_bytes", None)
+    monkeypatch.setattr(mask_store, "_unmeasured_bytes", 0)
+    return tmp_path
+
+def _mask(value):
+    return Image.fromarray(np.full((10, 10), value, dtype=np.uint8))
+
+def _age(key, mtime):
+    os.utime(_mask_path(key), (mtime, mtime))
+
+def test_round_trip(store):
+    save_mask(("a",), _mask(7))
+    assert os.path.getsize(_mask_path(("a",))) == MASK_FILE_BYTES
+    assert np.array_equal(np.asarray(load_mask(("a",))), np.full((10, 10), 7))
+    assert load_mask(("missing",)) is None
+
+def test_replaced_mask_is_counted_once(store):
+    save_mask(("a",), _mask(1))
+    save_mask(("a",), _mask(2))
+    save_mask(("a",), _mask(3))
+    assert mask_store._store_bytes == MASK_FILE_BYTES
+    assert np.asarray(load_mask(("a",)))[0, 0] == 3
+
+def test_eviction_frees_down_to_low_water(store):
+    for i in range(10):
+        save_mask((i,), _mask(i))
+        _age((i,), 1_000 + i)
+    save_mask((10,), _mask(10))
+    # Over the limit: the oldest masks go until at most 90% of it is used
+    remaining = [i for i in range(11) if os.path.exists(_mask_path((i,)))]
+    assert remaining == list(range(2, 11))
+    assert mask_store._store_bytes == 9 * MASK_FILE_BYTES
+
+def test_memory_hits_keep_the_stored_mask(store, monkeypatch):
+    monkeypatch.setattr(mask_cache, "_mask_cache", BoundedLRU(16, 1 << 20, image_nbytes))
+    for i in range(10):
+        mask_cache.put_cached_mask((i,), _mask(i))
+        _age((i,), 1_000 + i)
+    assert mask_cache.get_cached_mask((0,)) is not None
+    mask_cache.put_cached_mask((10,), _mask(10))
+    assert os.path.exists(_mask_path((0,)))
+    assert not os.path.exists(_mask_path((1,)))
+
+def test_writes_by_other_processes_are_measured(store):
+    save_mask(("first",), _mask(0))
+    _age(("first",), 1_000)
+    # Another process sharing the directory fills the store behind this one's running total
+    for i in range(9):
+        other = _mask_path(("other", i))
+        os.makedirs(os.path.dirname(other), exist_ok=True)
+        np.save(other, np.zeros((10, 10), dtype=np.uint8))
+        os.utime(other, (2_000 + i, 2_000 + i))
+    # A low-water headroom's worth of local writes triggers a fresh measurement, which finds the store over the limit
+    save_mask(("second",), _mask(1))
+    assert mask_store._store_bytes <= 9 * MASK_FILE_BYTES
+    assert not os.path.exists(_mask_path(("first",)))
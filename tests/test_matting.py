@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from PIL import Image
+from scipy.ndimage import binary_erosion
+from refinement import matte_edges, matting_available, trimap_from_mask
+
+def test_trimap_thresholds_without_erosion():
+    mask = np.array([[0, 9, 10, 128, 240, 241, 255]], dtype=np.uint8)
+    trimap = trimap_from_mask(mask, foreground_threshold=240, background_threshold=10, erode_size=0)
+    assert trimap.tolist() == [[0, 0, 128, 128, 128, 255, 255]]
+
+def test_separable_erosion_matches_a_square_structure():
+    rng = np.random.default_rng(0)
+    mask = (rng.random((40, 50)) > 0.5).astype(np.uint8) * 255
+    mask[5:30, 10:40] = 255
+    mask[32:, :20] = 0
+    trimap = trimap_from_mask(mask, erode_size=5)
+    square = np.ones((5, 5), dtype=bool)
+    assert np.array_equal(trimap == 255, binary_erosion(mask > 240, structure=square))
+    assert np.array_equal(trimap == 0, binary_erosion(mask < 10, structure=square, border_value=1))
+
+@pytest.mark.skipif(not matting_available(), reason="pymatting is not installed")
+def test_matting_keeps_definite_regions():
+    yy, xx = np.mgrid[0:120, 0:160]
+    inside = np.hypot(xx - 80, yy - 60) < 35
+    photo = np.where(inside[..., None], [220, 200, 180], [30, 60, 90]).astype(np.uint8)
+    mask = Image.fromarray(np.where(np.hypot(xx - 80, yy - 60) < 38, 255, 0).astype(np.uint8)).resize((160, 120), Image.Resampling.BOX)
+    alpha = np.asarray(mask)
+    trimap = trimap_from_mask(alpha)
+    matted = np.asarray(matte_edges(Image.fromarray(photo), mask, tile=64, pad=8))
+    assert matted.shape == alpha.shape
+    assert np.array_equal(matted[trimap != 128], alpha[trimap != 128])
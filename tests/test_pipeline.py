@@ -0,0 +1,88 @@
+import threading
+from pipeline import run_pipeline
+
+def _segment(chunk):
+    return [f"mask-{item}" for item in chunk]
+
+def _finish(item, mask):
+    return item, mask
+
+def _collect(results):
+    return {index: (result, error) for index, result, error in results}
+
+def test_empty_input_yields_nothing():
+    assert list(run_pipeline([], _segment, _finish, batch_size=4, workers=2)) == []
+    assert list(run_pipeline([], _segment, _finish, batch_size=4, workers=2, prepare=str.upper)) == []
+
+def test_every_item_is_finished_with_its_own_mask():
+    items = [f"img{i}" for i in range(7)]
+    results = _collect(run_pipeline(items, _segment, _finish, batch_size=3, workers=3, prepare=str.upper))
+    assert set(results) == set(range(7))
+    for index, (result, error) in results.items():
+        assert error is None
+        assert result == (items[index].upper(), f"mask-{items[index].upper()}")
+
+def test_prepare_failure_only_fails_that_item():
+    segmented = []
+
+    def prepare(item):
+        if item == "bad":
+            raise ValueError("cannot decode")
+        return item
+
+    def segment(chunk):
+        segmented.append(list(chunk))
+        return _segment(chunk)
+
+    items = ["a", "bad", "c", "d"]
+    results = _collect(run_pipeline(items, segment, _finish, batch_size=3, workers=2, prepare=prepare))
+    assert isinstance(results[1][1], ValueError) and results[1][0] is None
+    for index in (0, 2, 3):
+        assert results[index] == ((items[index], f"mask-{items[index]}"), None)
+    # The rest of the failed item's chunk is still segmented together, without it
+    assert ["a", "c"] in segmented
+
+def test_segment_failure_fails_the_whole_chunk_only():
+    def segment(chunk):
+        if "b" in chunk:
+            raise RuntimeError("inference failed")
+        return _segment(chunk)
+
+    items = ["a", "b", "c", "d"]
+    results = _collect(run_pipeline(items, segment, _finish, batch_size=2, workers=2))
+    for index in (0, 1):
+        assert results[index][0] is None and isinstance(results[index][1], RuntimeError)
+    for index in (2, 3):
+        assert results[index] == ((items[index], f"mask-{items[index]}"), None)
+
+def test_finish_failure_is_reported_per_item():
+    def finish(item, mask):
+        if item == "c":
+            raise ValueError("encode failed")
+        return item
+
+    results = _collect(run_pipeline(["a", "b", "c"], _segment, finish, batch_size=2, workers=2))
+    assert results[0] == ("a", None) and results[1] == ("b", None)
+    assert results[2][0] is None and isinstance(results[2][1], ValueError)
+
+def test_prepare_runs_a_bounded_number_of_chunks_ahead():
+    lock = threading.Lock()
+    prepared = []
+    seen_at_segment = []
+
+    def prepare(item):
+        with lock:
+            prepared.append(item)
+        return item
+
+    def segment(chunk):
+        with lock:
+            seen_at_segment.append(len(prepared))
+        return _segment(chunk)
+
+    batch_size, concurrency = 2, 1
+    list(run_pipeline(list(range(20)), segment, _finish, batch_size=batch_size, workers=4,
+                      inference_concurrency=concurrency, prepare=prepare))
+    # At most the segmenting chunks plus one more are decoded before the first chunk is segmented
+    assert seen_at_segment[0] <= (concurrency + 2) * batch_size
+    assert len(prepared) == 20
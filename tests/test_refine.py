@@ -0,0 +1,32 @@
+import numpy as np
+from PIL import Image
+from segmentation import REFINE_THRESHOLD, merge_refined_mask, refine_crop_box
+
+def _mask(size, box, value=255):
+    arr = np.zeros((size[1], size[0]), dtype=np.uint8)
+    arr[box[1]:box[3], box[0]:box[2]] = value
+    return Image.fromarray(arr)
+
+def test_crop_box_pads_the_subject_by_the_margin():
+    assert refine_crop_box(_mask((200, 100), (50, 20, 150, 80)), margin=0.1) == (40, 14, 160, 86)
+
+def test_crop_box_is_clamped_to_the_mask():
+    assert refine_crop_box(_mask((200, 100), (0, 0, 60, 40)), margin=0.5) == (0, 0, 90, 60)
+
+def test_faint_or_missing_subject_is_not_refined():
+    assert refine_crop_box(_mask((200, 100), (50, 20, 150, 80), value=REFINE_THRESHOLD)) is None
+    assert refine_crop_box(Image.new("L", (200, 100))) is None
+
+def test_subject_filling_the_frame_is_not_refined():
+    assert refine_crop_box(_mask((200, 100), (5, 5, 195, 95))) is None
+
+def test_merge_replaces_only_the_crop_region():
+    mask = _mask((200, 100), (50, 20, 150, 80), value=100)
+    box = (40, 14, 160, 86)
+    merged = merge_refined_mask(mask, Image.new("L", (120, 72), 200), box)
+    arr = np.asarray(merged)
+    assert (arr[14:86, 40:160] == 200).all()
+    outside = np.ones(arr.shape, dtype=bool)
+    outside[14:86, 40:160] = False
+    assert np.array_equal(arr[outside], np.asarray(mask)[outside])
+    assert np.asarray(mask)[50, 100] == 100  # the first-pass mask is left untouched
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+onnx = pytest.importorskip("onnx")
+import onnxruntime as ort
+from onnx import TensorProto, helper
+from rembg.sessions.u2net import U2netSession
+import segmentation
+
+def _toy_session(model_name):
+    """U2-Net-shaped session whose output is the sigmoid of the channel mean, with a dynamic batch axis"""
+    inputs = helper.make_tensor_value_info("input.1", TensorProto.FLOAT, ["N", 3, 320, 320])
+    outputs = helper.make_tensor_value_info("out", TensorProto.FLOAT, ["N", 1, 320, 320])
+    nodes = [
+        helper.make_node("ReduceMean", ["input.1"], ["mean"], axes=[1], keepdims=1),
+        helper.make_node("Sigmoid", ["mean"], ["out"]),
+    ]
+    model = helper.make_model(helper.make_graph(nodes, "toy", [inputs], [outputs]), opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    session = object.__new__(U2netSession)
+    session.inner_session = ort.InferenceSession(model.SerializeToString())
+    session.model_name = model_name
+    return session
+
+def _photo(size, seed):
+    """Dark frame with a bright rectangle, so the toy mask has a subject to refine on"""
+    rng = np.random.default_rng(seed)
+    arr = rng.integers(0, 40, (size[1], size[0], 3), dtype=np.uint8)
+    x0, y0 = size[0] // 4, size[1] // 5
+    arr[y0:size[1] - y0, x0:size[0] - x0] = rng.integers(200, 256, 3, dtype=np.uint8)
+    return Image.fromarray(arr)
+
+@pytest.mark.parametrize("refine", [False, True])
+def test_batched_masks_equal_single_image_masks(monkeypatch, refine):
+    monkeypatch.setitem(segmentation._sessions, ("u2net", False), _toy_session("u2net"))
+    images = [_photo((640, 480), 1), _photo((300, 500), 2), _photo((1200, 800), 3), _photo((320, 320), 4)]
+    batched = segmentation.predict_masks(images, "u2net", False, batch_size=3, refine=refine)
+    for img, mask in zip(images, batched):
+        single = segmentation.predict_mask(img, "u2net", False, refine=refine)
+        assert mask.mode == "L" and mask.size == img.size
+        assert np.array_equal(np.asarray(mask), np.asarray(single))
@@ -0,0 +1,43 @@
+import io
+from PIL import Image
+import validation
+from validation import draft_scale, validate_batch
+
+def _jpeg(size):
+    stream = io.BytesIO()
+    Image.new("RGB", size).save(stream, format="JPEG")
+    return stream.getvalue()
+
+def test_draft_scale_at_the_limits():
+    assert draft_scale((100, 100), 10_000) == 1
+    assert draft_scale((101, 100), 10_000) == 2
+    # Partial DCT blocks round up: 201 px at 1/2 scale is 101 px
+    assert draft_scale((200, 200), 10_000) == 2
+    assert draft_scale((201, 200), 10_000) == 4
+    assert draft_scale((800, 800), 10_000) == 8
+    assert draft_scale((801, 800), 10_000) == 0
+    assert draft_scale((1, 1), 1) == 1
+    assert draft_scale((1, 1), 0) == 0
+
+def test_oversized_jpeg_is_downscaled(monkeypatch):
+    monkeypatch.setattr(validation, "UPLOAD_MAX_PIXELS", 10_000)
+    monkeypatch.setattr(validation, "OVERSIZE_POLICY", "downscale")
+    [(error, max_pixels, notice)] = validate_batch([_jpeg((300, 300))])
+    assert error is None and max_pixels == 10_000 and "downscaled" in notice
+
+def test_oversized_jpeg_is_rejected_by_policy(monkeypatch):
+    monkeypatch.setattr(validation, "UPLOAD_MAX_PIXELS", 10_000)
+    monkeypatch.setattr(validation, "OVERSIZE_POLICY", "reject")
+    [(error, max_pixels, notice)] = validate_batch([_jpeg((300, 300))])
+    assert isinstance(error, validation.UploadRejected) and max_pixels is None
+
+def test_batch_pixel_budget_counts_downscaled_size(monkeypatch):
+    monkeypatch.setattr(validation, "UPLOAD_MAX_PIXELS", 10_000)
+    monkeypatch.setattr(validation, "BATCH_MAX_PIXELS", 20_000)
+    results = validate_batch([_jpeg((200, 200)), _jpeg((200, 200)), _jpeg((200, 200))])
+    # Each decodes at 1/2 scale (10,000 px), so two fit the budget and the third is rejected
+    assert [error is None for error, _, _ in results] == [True, True, False]
+
+def test_unreadable_upload_is_rejected():
+    [(error, _, _)] = validate_batch([b"not an image"])
+    assert isinstance(error, validation.UploadRejected)
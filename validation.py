@@ -0,0 +1,97 @@
+from PIL import Image
+import io
+import math
+from typing import List, Optional, Tuple
+from settings import get_setting
+
+# Per-upload and per-batch limits, checked from the file header before anything is decoded
+UPLOAD_MAX_BYTES = get_setting("uploads", "max_bytes", 50 * 1024 * 1024)
+UPLOAD_MAX_PIXELS = get_setting("uploads", "max_pixels", 50_000_000)
+BATCH_MAX_BYTES = get_setting("uploads", "max_batch_bytes", 500 * 1024 * 1024)
+BATCH_MAX_PIXELS = get_setting("uploads", "max_batch_pixels", 400_000_000)
+
+# What to do with an image over max_pixels: "downscale" (JPEG only, decoded at a reduced DCT scale) or "reject"
+OVERSIZE_POLICY = get_setting("uploads", "oversize", "downscale")
+
+# Formats accepted by the uploader
+ALLOWED_FORMATS = ("JPEG", "PNG", "WEBP")
+
+# JPEG can decode at 1/2, 1/4 or 1/8 scale
+_MAX_DRAFT_SCALE = 8
+
+class UploadRejected(ValueError):
+    """An upload that fails validation or exceeds a limit"""
+
+def _megapixels(pixels: float) -> str:
+    return f"{pixels / 1_000_000:.1f} MP"
+
+def read_header(data: bytes) -> Tuple[str, Tuple[int, int]]:
+    """
+    Sniff an upload's format and dimensions without decoding any pixel data
+
+    Args:
+        data (bytes): Uploaded file contents
+
+    Returns:
+        tuple: (format, (width, height))
+
+    Raises:
+        UploadRejected: If the file is not a supported image
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            image_format, size = img.format, img.size
+    except Exception as e:
+        raise UploadRejected(f"not a readable image ({e})")
+    if image_format not in ALLOWED_FORMATS:
+        raise UploadRejected(f"unsupported format {image_format}")
+    if size[0] <= 0 or size[1] <= 0:
+        raise UploadRejected("image has no pixels")
+    return image_format, size
+
+def draft_scale(size: Tuple[int, int], max_pixels: int) -> int:
+    """Smallest JPEG DCT scale (1, 2, 4 or 8) at which an image fits max_pixels, or 0 if none does"""
+    for scale in (1, 2, 4, _MAX_DRAFT_SCALE):
+        if math.ceil(size[0] / scale) * math.ceil(size[1] / scale) <= max_pixels:
+            return scale
+    return 0
+
+def validate_batch(uploads: List[bytes]) -> List[Tuple[Optional[UploadRejected], Optional[int], Optional[str]]]:
+    """
+    Check a batch of uploads against the byte and pixel limits, header only
+
+    Uploads are admitted in order until a batch limit is reached. Decoded pixel
+    counts are budgeted after any downscaling, so memory per request stays
+    bounded by BATCH_MAX_PIXELS.
+
+    Args:
+        uploads (list): File contents of each upload
+
+    Returns:
+        list: Per upload (error or None, pixel limit to decode with or None, notice or None)
+    """
+    results: List[Tuple[Optional[UploadRejected], Optional[int], Optional[str]]] = []
+    batch_bytes = 0
+    batch_pixels = 0
+    for data in uploads:
+        try:
+            if len(data) > UPLOAD_MAX_BYTES:
+                raise UploadRejected(f"file is {len(data) / 1024 / 1024:.1f} MB; the limit is {UPLOAD_MAX_BYTES / 1024 / 1024:.0f} MB")
+            image_format, size = read_header(data)
+            pixels = size[0] * size[1]
+            max_pixels, notice = None, None
+            if pixels > UPLOAD_MAX_PIXELS:
+                scale = draft_scale(size, UPLOAD_MAX_PIXELS) if image_format == "JPEG" else 0
+                if OVERSIZE_POLICY != "downscale" or not scale:
+                    raise UploadRejected(f"image is {size[0]}x{size[1]} ({_megapixels(pixels)}); the limit is {_megapixels(UPLOAD_MAX_PIXELS)}")
+                max_pixels = UPLOAD_MAX_PIXELS
+                pixels = math.ceil(size[0] / scale) * math.ceil(size[1] / scale)
+                notice = f"downscaled from {size[0]}x{size[1]} to fit the {_megapixels(UPLOAD_MAX_PIXELS)} limit"
+            if batch_bytes + len(data) > BATCH_MAX_BYTES or batch_pixels + pixels > BATCH_MAX_PIXELS:
+                raise UploadRejected("the batch size limit was reached; process the remaining images separately")
+            batch_bytes += len(data)
+            batch_pixels += pixels
+            results.append((None, max_pixels, notice))
+        except UploadRejected as e:
+            results.append((e, None, None))
+    return results